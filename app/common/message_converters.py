@@ -1,7 +1,7 @@
-import json
-from datetime import datetime
+from functools import lru_cache
 from typing import Literal, List
 
+import orjson
 from langchain_core.messages import (
     BaseMessage,
     HumanMessage,
@@ -81,7 +81,7 @@ def convert_langchain_tool_calls_to_iris_tool_calls(
         ToolCallDTO(
             function=FunctionDTO(
                 name=tc["name"],
-                arguments=json.dumps(tc["args"]),
+                arguments=orjson.dumps(tc["args"]).decode(),
             ),
             id=tc["id"],
         )
@@ -114,7 +114,6 @@ def convert_langchain_message_to_iris_message(
             return PyrisAIMessage(
                 contents=contents,
                 tool_calls=tool_calls,
-                send_at=datetime.now(),
             )
         else:
             contents = [TextMessageContentDTO(textContent=base_message.content)]
@@ -128,17 +127,16 @@ def convert_langchain_message_to_iris_message(
         ]
         return PyrisToolMessage(
             contents=contents,
-            send_at=datetime.now(),
         )
     else:
         raise ValueError(f"Unknown message type: {type(base_message)}")
     return PyrisMessage(
         contents=contents,
         sender=role,
-        send_at=datetime.now(),
     )
 
 
+@lru_cache(maxsize=16)
 def map_role_to_str(
     role: IrisMessageRole,
 ) -> Literal["user", "assistant", "system", "tool"]:
@@ -155,6 +153,7 @@ def map_role_to_str(
             raise ValueError(f"Unknown message role: {role}")
 
 
+@lru_cache(maxsize=16)
 def map_str_to_role(role: str) -> IrisMessageRole:
     match role:
         case "user":
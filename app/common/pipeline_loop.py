@@ -0,0 +1,41 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Coroutine
+
+try:
+    from uvloop import new_event_loop
+except ImportError:
+    from asyncio import new_event_loop
+
+# Async pipelines of all requests run interleaved on this one long-lived loop, so the async
+# OpenAI clients and their connection pools are created once and reused by every run
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def get_pipeline_loop() -> asyncio.AbstractEventLoop:
+    """Get the event loop the async pipelines run on, starting it on its own thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = new_event_loop()
+            threading.Thread(
+                target=_loop.run_forever, name="pipeline-loop", daemon=True
+            ).start()
+    return _loop
+
+
+def run_on_pipeline_loop(coroutine: Coroutine) -> Future:
+    """
+    Schedule the coroutine on the pipeline loop and return without waiting for it.
+    The coroutine shares the loop with all other runs, so it must not block it with synchronous I/O.
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, get_pipeline_loop())
+
+
+def stop_pipeline_loop():
+    """Stop the pipeline loop. Runs that are still in progress are abandoned."""
+    with _loop_lock:
+        if _loop is not None:
+            _loop.call_soon_threadsafe(_loop.stop)
@@ -3,6 +3,11 @@ from pathlib import Path
 from pydantic import BaseModel
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 class APIKeyConfig(BaseModel):
     token: str
@@ -31,7 +36,7 @@ class Settings(BaseModel):
         file_path = Path(file_path_env)
         try:
             with open(file_path, "r") as file:
-                settings_file = yaml.safe_load(file)
+                settings_file = yaml.load(file, Loader=SafeLoader)
             return cls.model_validate(settings_file)
         except FileNotFoundError as e:
             raise FileNotFoundError(
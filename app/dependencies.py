@@ -17,9 +17,15 @@ def _get_api_key(request: Request) -> str:
     return authorization_header
 
 
+# The settings are only loaded once, so the tokens are indexed once instead of scanned on every request
+_api_keys_by_token: dict[str, APIKeyConfig] = {
+    key.token: key for key in settings.api_keys
+}
+
+
 class TokenValidator:
     async def __call__(self, api_key: str = Depends(_get_api_key)) -> APIKeyConfig:
-        for key in settings.api_keys:
-            if key.token == api_key:
-                return key
-        raise PermissionDeniedException
+        key = _api_keys_by_token.get(api_key)
+        if key is None:
+            raise PermissionDeniedException
+        return key
@@ -1,10 +1,12 @@
 from datetime import datetime
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class BuildLogEntryDTO(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     timestamp: Optional[datetime] = None
     message: Optional[str] = None
 
@@ -1,9 +1,11 @@
 from typing import Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class FeedbackDTO(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
     text: Optional[str] = None
     test_case_name: Optional[str] = Field(alias="testCaseName", default=None)
     credits: float
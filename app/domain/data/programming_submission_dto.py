@@ -1,6 +1,6 @@
 from typing import List, Dict, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 from datetime import datetime
 from ...domain.data.build_log_entry import BuildLogEntryDTO
@@ -8,6 +8,9 @@ from ...domain.data.result_dto import ResultDTO
 
 
 class ProgrammingSubmissionDTO(BaseModel):
+    # Frozen only prevents reassigning fields. The list and dict fields stay mutable and make it unhashable.
+    model_config = ConfigDict(frozen=True)
+
     id: int
     date: Optional[datetime] = None
     repository: Dict[str, str] = Field(alias="repository", default={})
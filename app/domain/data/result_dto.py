@@ -1,12 +1,15 @@
 from datetime import datetime
 from typing import List, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 from ...domain.data.feedback_dto import FeedbackDTO
 
 
 class ResultDTO(BaseModel):
+    # Frozen only prevents reassigning fields. The list and dict fields stay mutable and make it unhashable.
+    model_config = ConfigDict(frozen=True)
+
     completion_date: Optional[datetime] = Field(alias="completionDate", default=None)
     successful: bool = Field(alias="successful", default=False)
     feedbacks: List[FeedbackDTO] = Field(alias="feedbacks", default=[])
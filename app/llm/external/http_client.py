@@ -0,0 +1,48 @@
+import asyncio
+from functools import lru_cache
+
+import httpx
+from openai import APIError, APIStatusError, DefaultAsyncHttpxClient, DefaultHttpxClient
+
+from app.common.pipeline_loop import get_pipeline_loop
+
+# All models talk to a handful of hosts, so a single pool with HTTP/2 lets concurrent requests
+# multiplex over few TLS connections instead of opening one per model and thread.
+# Pipelines call the models in bursts with pauses in between, e.g. while retrieving lecture content,
+# so idle connections are kept for longer than the default 5 seconds to avoid new TLS handshakes.
+_limits = httpx.Limits(
+    max_connections=100, max_keepalive_connections=100, keepalive_expiry=60
+)
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """Get the HTTP client shared by all synchronous OpenAI clients."""
+    return DefaultHttpxClient(http2=True, limits=_limits)
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Get the HTTP client shared by all asynchronous OpenAI clients.
+    An async connection pool is bound to the loop it is used on, so async model calls must run on the pipeline loop.
+    """
+    if asyncio.get_running_loop() is not get_pipeline_loop():
+        raise RuntimeError("Async model calls must run on the pipeline loop")
+    return _get_async_http_client()
+
+
+@lru_cache(maxsize=1)
+def _get_async_http_client() -> httpx.AsyncClient:
+    return DefaultAsyncHttpxClient(http2=True, limits=_limits)
+
+
+def is_retryable_error(error: APIError | httpx.TransportError) -> bool:
+    """
+    Check whether an OpenAI error may go away on retry. Client errors such as an invalid request,
+    a missing deployment or a too long prompt fail the same way every time, so only timeouts,
+    conflicts, rate limits, server errors and connection errors are retried.
+    Errors of an interrupted stream are raised by httpx directly and always count as connection errors.
+    """
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return True
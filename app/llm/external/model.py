@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABCMeta, abstractmethod
 from typing import Sequence, Union, Dict, Any, Type, Callable
 from langchain_core.tools import BaseTool
@@ -49,6 +50,12 @@ class ChatModel(LanguageModel, metaclass=ABCMeta):
             f"The LLM {self.__str__()} does not support chat completion"
         )
 
+    async def achat(
+        self, messages: list[PyrisMessage], arguments: CompletionArguments
+    ) -> PyrisMessage:
+        """Create a completion from the chat messages without blocking the event loop"""
+        return await asyncio.to_thread(self.chat, messages, arguments)
+
     @abstractmethod
     def bind_tools(
         self,
@@ -74,6 +81,10 @@ class EmbeddingModel(LanguageModel, metaclass=ABCMeta):
             f"The LLM {self.__str__()} does not support embeddings"
         )
 
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """Create embeddings for multiple texts, one request per text unless overridden"""
+        return [self.embed(text) for text in texts]
+
 
 class ImageGenerationModel(LanguageModel, metaclass=ABCMeta):
     """Abstract class for the llm image generation wrappers"""
@@ -1,23 +1,44 @@
-import json
+import asyncio
 import logging
+import random
 import time
 from datetime import datetime
-from typing import Literal, Any, Sequence, Union, Dict, Type, Callable, Optional
+from typing import (
+    AsyncIterator,
+    Literal,
+    Any,
+    Sequence,
+    Union,
+    Dict,
+    Type,
+    Callable,
+    Optional,
+    Hashable,
+)
 
+import httpx
+import orjson
 from langchain_core.tools import BaseTool
 from langchain_core.utils.function_calling import convert_to_openai_tool
 from openai import (
     OpenAI,
+    AsyncOpenAI,
     APIError,
     APITimeoutError,
     RateLimitError,
     ContentFilterFinishReasonError,
 )
-from openai.lib.azure import AzureOpenAI
+from openai.lib.azure import AzureOpenAI, AsyncAzureOpenAI
 from openai.types import CompletionUsage
-from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageParam
+from openai.types.chat import (
+    ChatCompletionChunk,
+    ChatCompletionMessage,
+    ChatCompletionMessageParam,
+    ChatCompletionMessageToolCall,
+)
+from openai.types.chat.chat_completion_message_tool_call import Function
 from openai.types.shared_params import ResponseFormatJSONObject
-from pydantic import Field, BaseModel
+from pydantic import Field, BaseModel, PrivateAttr
 
 from app.domain.data.text_message_content_dto import TextMessageContentDTO
 from ...common.message_converters import map_role_to_str, map_str_to_role
@@ -28,28 +49,58 @@ from ...domain.data.json_message_content_dto import JsonMessageContentDTO
 from ...domain.data.tool_call_dto import ToolCallDTO
 from ...domain.data.tool_message_content_dto import ToolMessageContentDTO
 from ...llm import CompletionArguments
+from ...llm.external.http_client import (
+    get_async_http_client,
+    get_http_client,
+    is_retryable_error,
+)
 from ...llm.external.model import ChatModel
 
 
-def convert_content_to_openai_format(content):
-    """Convert a single content item to OpenAI format."""
-    content_type_mapping = {
-        ImageMessageContentDTO: lambda c: {
-            "type": "image_url",
-            "image_url": {
-                "url": f"data:image/jpeg;base64,{c.base64}",
-                "detail": "high",
-            },
+# The tool functions are recreated as closures on every pipeline run, so their schema is cached by code object
+_openai_tool_cache: dict[Hashable, dict[str, Any]] = {}
+
+
+def _openai_tool_cache_key(
+    tool: Union[Dict[str, Any], Type[BaseModel], Callable, BaseTool]
+) -> Optional[Hashable]:
+    """Get a key that is stable across re-creations of the same tool, or None if the tool cannot be cached."""
+    if isinstance(tool, BaseTool):
+        code = getattr(getattr(tool, "func", None), "__code__", None)
+        return (tool.name, tool.description, code) if code else None
+    if isinstance(tool, type):
+        return tool
+    return getattr(tool, "__code__", None)
+
+
+def convert_to_cached_openai_tool(
+    tool: Union[Dict[str, Any], Type[BaseModel], Callable, BaseTool]
+) -> dict[str, Any]:
+    """Convert a tool to the OpenAI tool schema, reusing the schema if the tool was converted before."""
+    key = _openai_tool_cache_key(tool)
+    if key is None:
+        return convert_to_openai_tool(tool)
+    openai_tool = _openai_tool_cache.get(key)
+    if openai_tool is None:
+        openai_tool = convert_to_openai_tool(tool)
+        _openai_tool_cache[key] = openai_tool
+    return openai_tool
+
+
+_content_type_mapping = {
+    ImageMessageContentDTO: lambda c: {
+        "type": "image_url",
+        "image_url": {
+            "url": f"data:image/jpeg;base64,{c.base64}",
+            "detail": "high",
         },
-        TextMessageContentDTO: lambda c: {"type": "text", "text": c.text_content},
-        JsonMessageContentDTO: lambda c: {
-            "type": "json_object",
-            "json_object": c.json_content,
-        },
-    }
-
-    converter = content_type_mapping.get(type(content))
-    return converter(content) if converter else None
+    },
+    TextMessageContentDTO: lambda c: {"type": "text", "text": c.text_content},
+    JsonMessageContentDTO: lambda c: {
+        "type": "json_object",
+        "json_object": c.json_content,
+    },
+}
 
 
 def handle_tool_message(content):
@@ -71,13 +122,22 @@ def create_openai_tool_calls(tool_calls):
             "type": tool.type,
             "function": {
                 "name": tool.function.name,
-                "arguments": json.dumps(tool.function.arguments),
+                "arguments": orjson.dumps(tool.function.arguments).decode(),
             },
         }
         for tool in tool_calls
     ]
 
 
+def _is_text_only_message(message: PyrisMessage) -> bool:
+    """Check whether a message is a plain PyrisMessage with only text contents."""
+    return (
+        type(message) is PyrisMessage
+        and message.sender != "TOOL"
+        and all(type(content) is TextMessageContentDTO for content in message.contents)
+    )
+
+
 def convert_to_open_ai_messages(
     messages: list[PyrisMessage],
 ) -> list[ChatCompletionMessageParam]:
@@ -90,23 +150,37 @@ def convert_to_open_ai_messages(
     Returns:
         List of messages in OpenAI's format
     """
+    # Most chat histories are plain text, which needs no per-content dispatch or tool handling
+    if all(_is_text_only_message(message) for message in messages):
+        return [
+            {
+                "role": map_role_to_str(message.sender),
+                "content": [
+                    {"type": "text", "text": content.text_content}
+                    for content in message.contents
+                ],
+            }
+            for message in messages
+        ]
+
     openai_messages = []
 
     for message in messages:
         if message.sender == "TOOL":
             # Handle tool messages
-            for content in message.contents:
-                tool_message = handle_tool_message(content)
-                if tool_message:
-                    openai_messages.append(tool_message)
+            openai_messages.extend(
+                tool_message
+                for content in message.contents
+                if (tool_message := handle_tool_message(content))
+            )
             continue
 
         # Handle regular messages
-        openai_content = []
-        for content in message.contents:
-            formatted_content = convert_content_to_openai_format(content)
-            if formatted_content:
-                openai_content.append(formatted_content)
+        openai_content = [
+            converter(content)
+            for content in message.contents
+            if (converter := _content_type_mapping.get(type(content)))
+        ]
 
         # Create the message object
         openai_message = {
@@ -165,7 +239,10 @@ def create_iris_tool_calls(message_tool_calls) -> list[ToolCallDTO]:
 
 
 def convert_to_iris_message(
-    message: ChatCompletionMessage, usage: Optional[CompletionUsage], model: str
+    message: ChatCompletionMessage,
+    usage: Optional[CompletionUsage],
+    model: str,
+    sent_at: Optional[datetime] = None,
 ) -> PyrisMessage:
     """
     Convert a ChatCompletionMessage to a PyrisMessage.
@@ -174,99 +251,300 @@ def convert_to_iris_message(
         message: The ChatCompletionMessage to convert
         usage: Optional token usage information
         model: The model name used for the completion
+        sent_at: The time the response was received, defaults to now
 
     Returns:
         PyrisMessage or PyrisAIMessage depending on presence of tool calls
     """
     token_usage = create_token_usage(usage, model)
-    current_time = datetime.now()
+    if sent_at is None:
+        sent_at = datetime.now()
 
     if message.tool_calls:
         return PyrisAIMessage(
             tool_calls=create_iris_tool_calls(message.tool_calls),
             contents=[TextMessageContentDTO(textContent="")],
-            sendAt=current_time,
+            sentAt=sent_at,
             token_usage=token_usage,
         )
 
     return PyrisMessage(
         sender=map_str_to_role(message.role),
         contents=[TextMessageContentDTO(textContent=message.content)],
-        sendAt=current_time,
+        sentAt=sent_at,
         token_usage=token_usage,
     )
 
 
+class StreamAccumulator:
+    """
+    Collects the chunks of a streamed chat completion into the same message
+    a non-streamed completion would have returned.
+    """
+
+    def __init__(self):
+        self.model: Optional[str] = None
+        self.role: str = "assistant"
+        self.finish_reason: Optional[str] = None
+        self.usage: Optional[CompletionUsage] = None
+        self.content_parts: list[str] = []
+        self.tool_calls: dict[int, dict[str, Any]] = {}
+
+    def add(self, chunk: ChatCompletionChunk) -> Optional[str]:
+        """Add a chunk and return its text delta, if any."""
+        self.model = chunk.model or self.model
+        # With include_usage, the last chunk carries the usage and no choices
+        if chunk.usage is not None:
+            self.usage = chunk.usage
+        if not chunk.choices:
+            return None
+        choice = chunk.choices[0]
+        if choice.finish_reason:
+            self.finish_reason = choice.finish_reason
+        delta = choice.delta
+        if delta is None:
+            return None
+        if delta.role:
+            self.role = delta.role
+        for tool_call in delta.tool_calls or []:
+            # Tool calls arrive in fragments, only the first of which carries the id and name
+            accumulated = self.tool_calls.setdefault(
+                tool_call.index, {"id": None, "name": "", "arguments": []}
+            )
+            if tool_call.id:
+                accumulated["id"] = tool_call.id
+            if tool_call.function:
+                if tool_call.function.name:
+                    accumulated["name"] += tool_call.function.name
+                if tool_call.function.arguments:
+                    accumulated["arguments"].append(tool_call.function.arguments)
+        if delta.content:
+            self.content_parts.append(delta.content)
+            return delta.content
+        return None
+
+    def to_message(self) -> ChatCompletionMessage:
+        """Assemble the accumulated chunks into a ChatCompletionMessage."""
+        tool_calls = [
+            ChatCompletionMessageToolCall(
+                id=tool_call["id"],
+                type="function",
+                function=Function(
+                    name=tool_call["name"],
+                    arguments="".join(tool_call["arguments"]),
+                ),
+            )
+            for _, tool_call in sorted(self.tool_calls.items())
+        ]
+        return ChatCompletionMessage(
+            role=self.role,
+            content="".join(self.content_parts) if self.content_parts else None,
+            tool_calls=tool_calls or None,
+        )
+
+
 class OpenAIChatModel(ChatModel):
     model: str
     api_key: str
     tools: Optional[
         Sequence[Union[Dict[str, Any], Type[BaseModel], Callable, BaseTool]]
     ] = Field(default_factory=list, alias="tools")
+    _client: OpenAI
+    # Created on first use, all async calls run on the shared pipeline loop
+    _async_client: Optional[AsyncOpenAI] = PrivateAttr(default=None)
+
+    # Expected wait time: 1 + 2 + 4 + 8 + 16 = 31 seconds, jittered by +-50%
+    _retries = 5
+    _backoff_factor = 2
+    _initial_delay = 1
+    _max_delay = 60
+
+    def _create_params(
+        self, messages: list[PyrisMessage], arguments: CompletionArguments
+    ) -> dict[str, Any]:
+        params = {
+            "model": self.model,
+            "messages": convert_to_open_ai_messages(messages),
+            "temperature": arguments.temperature,
+            "max_tokens": arguments.max_tokens,
+        }
+        if arguments.response_format == "JSON":
+            params["response_format"] = ResponseFormatJSONObject(type="json_object")
+        if self.tools:
+            params["tools"] = self.tools
+        return params
+
+    def _supports_stream_usage(self) -> bool:
+        """Whether the API accepts stream_options, without which a stream carries no token usage."""
+        return False
+
+    def _create_stream_params(
+        self, messages: list[PyrisMessage], arguments: CompletionArguments
+    ) -> dict[str, Any]:
+        params = self._create_params(messages, arguments)
+        params["stream"] = True
+        params["stream_options"] = {"include_usage": True}
+        return params
+
+    @staticmethod
+    def _convert_response(response, sent_at: datetime) -> PyrisMessage:
+        choice = response.choices[0]
+        if choice.finish_reason == "content_filter":
+            # I figured that an openai error would be automatically raised if the content filter activated,
+            # but it seems that that is not the case.
+            # We don't want to retry because the same message will likely be rejected again.
+            # Raise an exception to trigger the global error handler and report a fatal error to the client.
+            raise ContentFilterFinishReasonError()
+        return convert_to_iris_message(
+            choice.message, response.usage, response.model, sent_at
+        )
+
+    @staticmethod
+    def _convert_stream_response(
+        accumulator: StreamAccumulator, sent_at: datetime
+    ) -> PyrisMessage:
+        if accumulator.finish_reason == "content_filter":
+            # See _convert_response
+            raise ContentFilterFinishReasonError()
+        return convert_to_iris_message(
+            accumulator.to_message(), accumulator.usage, accumulator.model, sent_at
+        )
+
+    def _create_async_client(self) -> AsyncOpenAI:
+        raise NotImplementedError
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = self._create_async_client()
+        return self._async_client
+
+    def _get_wait_time(self, attempt: int, error: APIError) -> float:
+        """
+        Get the time to wait before the next attempt. The exponential backoff is jittered so that
+        workers hitting the same rate limit do not retry in lockstep, and the retry-after header
+        of the API takes precedence when present.
+        """
+        backoff = min(
+            self._max_delay, self._initial_delay * (self._backoff_factor**attempt)
+        )
+        wait_time = backoff * (0.5 + random.random())
+        retry_after = None
+        if isinstance(error, RateLimitError):
+            try:
+                retry_after = float(error.response.headers.get("retry-after"))
+            except (TypeError, ValueError):
+                pass
+        if retry_after is not None:
+            wait_time = min(self._max_delay, retry_after)
+        logging.exception(f"OpenAI error on attempt {attempt + 1}:")
+        logging.info(
+            f"Retrying in {wait_time:.2f} seconds (backoff: {backoff}s, retry-after: {retry_after})..."
+        )
+        return wait_time
 
     def chat(
         self, messages: list[PyrisMessage], arguments: CompletionArguments
     ) -> PyrisMessage:
         # noinspection PyTypeChecker
-        retries = 5
-        backoff_factor = 2
-        initial_delay = 1
-        client = self.get_client()
-        # Maximum wait time: 1 + 2 + 4 + 8 + 16 = 31 seconds
-
-        messages = convert_to_open_ai_messages(messages)
+        params = self._create_params(messages, arguments)
+        for attempt in range(self._retries):
+            try:
+                response = self._client.chat.completions.create(**params)
+                return self._convert_response(response, datetime.now())
+            except (
+                APIError,
+                APITimeoutError,
+                RateLimitError,
+            ) as e:
+                if not is_retryable_error(e):
+                    raise
+                time.sleep(self._get_wait_time(attempt, e))
+        raise Exception(
+            f"Failed to get response from OpenAI after {self._retries} retries"
+        )
 
-        for attempt in range(retries):
+    async def achat(
+        self, messages: list[PyrisMessage], arguments: CompletionArguments
+    ) -> PyrisMessage:
+        message = None
+        # The deltas are dropped here, so a failure midway can be retried without duplicating text
+        async for item in self.achat_stream(
+            messages, arguments, retry_after_content=True
+        ):
+            if isinstance(item, PyrisMessage):
+                message = item
+        return message
+
+    async def achat_stream(
+        self,
+        messages: list[PyrisMessage],
+        arguments: CompletionArguments,
+        retry_after_content: bool = False,
+    ) -> AsyncIterator[Union[str, PyrisMessage]]:
+        """
+        Stream the completion. Yields the text deltas as they arrive and finally the complete
+        PyrisMessage including tool calls and token usage. Once text has been yielded, failures
+        are no longer retried, as a caller forwarding the deltas would otherwise send the text twice.
+        Callers that only use the final message can pass retry_after_content to retry them anyway.
+        If the API cannot include the token usage in a stream, the completion is requested
+        non-streamed and only the complete PyrisMessage is yielded.
+        """
+        stream = self._supports_stream_usage()
+        # noinspection PyTypeChecker
+        params = (
+            self._create_stream_params(messages, arguments)
+            if stream
+            else self._create_params(messages, arguments)
+        )
+        client = self._get_async_client()
+        for attempt in range(self._retries):
+            accumulator = StreamAccumulator()
             try:
-                params = {
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": arguments.temperature,
-                    "max_tokens": arguments.max_tokens,
-                }
-
-                if arguments.response_format == "JSON":
-                    params["response_format"] = ResponseFormatJSONObject(
-                        type="json_object"
-                    )
-
-                if self.tools:
-                    params["tools"] = self.tools
-
-                response = client.chat.completions.create(**params)
-                choice = response.choices[0]
-                usage = response.usage
-                model = response.model
-                if choice.finish_reason == "content_filter":
-                    # I figured that an openai error would be automatically raised if the content filter activated,
-                    # but it seems that that is not the case.
-                    # We don't want to retry because the same message will likely be rejected again.
-                    # Raise an exception to trigger the global error handler and report a fatal error to the client.
-                    raise ContentFilterFinishReasonError()
-                return convert_to_iris_message(choice.message, usage, model)
+                if not stream:
+                    response = await client.chat.completions.create(**params)
+                    yield self._convert_response(response, datetime.now())
+                    return
+                async with await client.chat.completions.create(**params) as chunks:
+                    async for chunk in chunks:
+                        delta = accumulator.add(chunk)
+                        if delta:
+                            yield delta
+                yield self._convert_stream_response(accumulator, datetime.now())
+                return
             except (
                 APIError,
                 APITimeoutError,
                 RateLimitError,
-            ):
-                wait_time = initial_delay * (backoff_factor**attempt)
-                logging.exception(f"OpenAI error on attempt {attempt + 1}:")
-                logging.info(f"Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-        raise Exception(f"Failed to get response from OpenAI after {retries} retries")
+                # A connection dropped or timed out midway through the stream is not wrapped by the SDK
+                httpx.TransportError,
+            ) as e:
+                if not is_retryable_error(e) or (
+                    accumulator.content_parts and not retry_after_content
+                ):
+                    raise
+                await asyncio.sleep(self._get_wait_time(attempt, e))
+        raise Exception(
+            f"Failed to get response from OpenAI after {self._retries} retries"
+        )
 
     def bind_tools(
         self,
         tools: Sequence[Union[Dict[str, Any], Type[BaseModel], Callable, BaseTool]],
     ):
-        self.tools = [convert_to_openai_tool(tool) for tool in tools]
+        self.tools = [convert_to_cached_openai_tool(tool) for tool in tools]
 
 
 class DirectOpenAIChatModel(OpenAIChatModel):
     type: Literal["openai_chat"]
 
-    def get_client(self) -> OpenAI:
-        return OpenAI(api_key=self.api_key)
+    def model_post_init(self, __context: Any) -> None:
+        self._client = OpenAI(api_key=self.api_key, http_client=get_http_client())
+
+    def _supports_stream_usage(self) -> bool:
+        return True
+
+    def _create_async_client(self) -> AsyncOpenAI:
+        return AsyncOpenAI(api_key=self.api_key, http_client=get_async_http_client())
 
     def __str__(self):
         return f"OpenAIChat('{self.model}')"
@@ -278,12 +556,26 @@ class AzureOpenAIChatModel(OpenAIChatModel):
     azure_deployment: str
     api_version: str
 
-    def get_client(self) -> OpenAI:
-        return AzureOpenAI(
+    def model_post_init(self, __context: Any) -> None:
+        self._client = AzureOpenAI(
+            azure_endpoint=self.endpoint,
+            azure_deployment=self.azure_deployment,
+            api_version=self.api_version,
+            api_key=self.api_key,
+            http_client=get_http_client(),
+        )
+
+    def _supports_stream_usage(self) -> bool:
+        # Azure rejects stream_options on API versions before 2024-09-01-preview
+        return str(self.api_version)[:10] >= "2024-09-01"
+
+    def _create_async_client(self) -> AsyncOpenAI:
+        return AsyncAzureOpenAI(
             azure_endpoint=self.endpoint,
             azure_deployment=self.azure_deployment,
             api_version=self.api_version,
             api_key=self.api_key,
+            http_client=get_async_http_client(),
         )
 
     def __str__(self):
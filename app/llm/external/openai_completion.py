@@ -3,6 +3,7 @@ from openai import OpenAI
 from openai.lib.azure import AzureOpenAI
 
 from ...llm import CompletionArguments
+from ...llm.external.http_client import get_http_client
 from ...llm.external.model import CompletionModel
 
 
@@ -26,7 +27,7 @@ class DirectOpenAICompletionModel(OpenAICompletionModel):
     type: Literal["openai_completion"]
 
     def model_post_init(self, __context: Any) -> None:
-        self._client = OpenAI(api_key=self.api_key)
+        self._client = OpenAI(api_key=self.api_key, http_client=get_http_client())
 
     def __str__(self):
         return f"OpenAICompletion('{self.model}')"
@@ -44,6 +45,7 @@ class AzureOpenAICompletionModel(OpenAICompletionModel):
             azure_deployment=self.azure_deployment,
             api_version=self.api_version,
             api_key=self.api_key,
+            http_client=get_http_client(),
         )
 
     def __str__(self):
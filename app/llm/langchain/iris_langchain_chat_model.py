@@ -2,7 +2,10 @@ import logging
 from logging import Logger
 from typing import List, Optional, Any, Sequence, Union, Dict, Type, Callable
 
-from langchain_core.callbacks import CallbackManagerForLLMRun
+from langchain_core.callbacks import (
+    CallbackManagerForLLMRun,
+    AsyncCallbackManagerForLLMRun,
+)
 from langchain_core.language_models import LanguageModelInput
 from langchain_core.language_models.chat_models import (
     BaseChatModel,
@@ -16,6 +19,7 @@ from pydantic import BaseModel
 
 from app.common.PipelineEnum import PipelineEnum
 from app.common.token_usage_dto import TokenUsageDTO
+from ...common.pyris_message import PyrisMessage
 from ...common.message_converters import (
     convert_langchain_message_to_iris_message,
     convert_iris_message_to_langchain_message,
@@ -78,6 +82,23 @@ class IrisLangchainChatModel(BaseChatModel):
         iris_messages = [convert_langchain_message_to_iris_message(m) for m in messages]
         self.completion_args.stop = stop
         iris_message = self.request_handler.chat(iris_messages, self.completion_args)
+        return self._create_chat_result(iris_message)
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        iris_messages = [convert_langchain_message_to_iris_message(m) for m in messages]
+        self.completion_args.stop = stop
+        iris_message = await self.request_handler.achat(
+            iris_messages, self.completion_args
+        )
+        return self._create_chat_result(iris_message)
+
+    def _create_chat_result(self, iris_message: PyrisMessage) -> ChatResult:
         base_message = convert_iris_message_to_langchain_message(iris_message)
         chat_generation = ChatGeneration(message=base_message)
         self.tokens = TokenUsageDTO(
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Any
 
 from langchain_core.callbacks import CallbackManagerForLLMRun
@@ -24,13 +25,19 @@ class IrisLangchainCompletionModel(BaseLLM):
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> LLMResult:
-        generations = []
         args = CompletionArguments(stop=stop, temperature=0.0)
         if self.max_tokens:
             args.max_tokens = self.max_tokens
-        for prompt in prompts:
+
+        def complete(prompt: str) -> List[Generation]:
             completion = self.request_handler.complete(prompt=prompt, arguments=args)
-            generations.append([Generation(text=completion.choices[0].text)])
+            return [Generation(text=completion.choices[0].text)]
+
+        if len(prompts) < 2:
+            return LLMResult(generations=[complete(prompt) for prompt in prompts])
+        # The requests are I/O bound, so run them concurrently. map keeps the input order.
+        with ThreadPoolExecutor(max_workers=min(len(prompts), 8)) as executor:
+            generations = list(executor.map(complete, prompts))
         return LLMResult(generations=generations)
 
     @property
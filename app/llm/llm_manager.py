@@ -5,6 +5,11 @@ from pydantic import BaseModel, Discriminator
 
 import yaml
 
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 from ..common import Singleton
 from ..llm.capability import RequirementList
 from ..llm.capability.capability_checker import (
@@ -38,7 +43,7 @@ class LlmManager(metaclass=Singleton):
             raise Exception("LLM_CONFIG_PATH not set")
 
         with open(path, "r") as file:
-            loaded_llms = yaml.safe_load(file)
+            loaded_llms = yaml.load(file, Loader=SafeLoader)
 
         self.entries = LlmList.model_validate({"llms": loaded_llms}).llms
 
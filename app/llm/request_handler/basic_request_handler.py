@@ -37,10 +37,20 @@ class BasicRequestHandler(RequestHandler):
         llm = self.llm_manager.get_llm_by_id(self.model_id)
         return llm.chat(messages, arguments)
 
+    async def achat(
+        self, messages: list[PyrisMessage], arguments: CompletionArguments
+    ) -> PyrisMessage:
+        llm = self.llm_manager.get_llm_by_id(self.model_id)
+        return await llm.achat(messages, arguments)
+
     def embed(self, text: str) -> list[float]:
         llm = self.llm_manager.get_llm_by_id(self.model_id)
         return llm.embed(text)
 
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        llm = self.llm_manager.get_llm_by_id(self.model_id)
+        return llm.embed_batch(texts)
+
     def bind_tools(
         self,
         tools: Sequence[Union[Dict[str, Any], Type[BaseModel], Callable, BaseTool]],
@@ -58,10 +58,23 @@ class CapabilityRequestHandler(RequestHandler):
         message.token_usage.cost_per_output_token = llm.capabilities.output_cost.value
         return message
 
+    async def achat(
+        self, messages: list[PyrisMessage], arguments: CompletionArguments
+    ) -> PyrisMessage:
+        llm = self._select_model(ChatModel)
+        message = await llm.achat(messages, arguments)
+        message.token_usage.cost_per_input_token = llm.capabilities.input_cost.value
+        message.token_usage.cost_per_output_token = llm.capabilities.output_cost.value
+        return message
+
     def embed(self, text: str) -> list[float]:
         llm = self._select_model(EmbeddingModel)
         return llm.embed(text)
 
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        llm = self._select_model(EmbeddingModel)
+        return llm.embed_batch(texts)
+
     def _select_model(self, type_filter: type) -> LanguageModel:
         """Select the best/worst model based on the requirements and the selection mode"""
         llms = self.llm_manager.get_llms_sorted_by_capabilities_score(
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABCMeta, abstractmethod
 from typing import Optional, Sequence, Union, Dict, Any, Type, Callable
 from langchain_core.tools import BaseTool
@@ -38,11 +39,21 @@ class RequestHandler(BaseModel, metaclass=ABCMeta):
         """Create a completion from the chat messages"""
         raise NotImplementedError
 
+    async def achat(
+        self, messages: list[any], arguments: CompletionArguments
+    ) -> PyrisMessage:
+        """Create a completion from the chat messages without blocking the event loop"""
+        return await asyncio.to_thread(self.chat, messages, arguments)
+
     @abstractmethod
     def embed(self, text: str) -> list[float]:
         """Create an embedding from the text"""
         raise NotImplementedError
 
+    def embed_batch(self, texts: list[str]) -> list[list[float]]:
+        """Create embeddings for multiple texts"""
+        return [self.embed(text) for text in texts]
+
     @abstractmethod
     def bind_tools(
         self,
@@ -1,24 +1,45 @@
+from contextlib import asynccontextmanager
+
 from fastapi.responses import ORJSONResponse
 from starlette.background import BackgroundTask
 from starlette.responses import Response
 
+from app.common.pipeline_loop import stop_pipeline_loop
 from app.config import settings
 import app.sentry as sentry
 from app.web.routers.health import router as health_router
-from app.web.routers.pipelines import router as pipelines_router
+from app.web.routers.pipelines import (
+    router as pipelines_router,
+    shutdown_pipeline_executor,
+)
 from app.web.routers.webhooks import router as webhooks_router
 from app.web.routers.ingestion_status import router as ingestion_status_router
+from app.vector_database.database import VectorDatabase
 
 import logging
 from fastapi import FastAPI, Request, status
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
 
 settings.set_env_vars()
 
 sentry.init()
 
-app = FastAPI(default_response_class=ORJSONResponse)
+
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    # Connect to Weaviate on startup so the first request does not pay for the
+    # connection and schema setup. If it is not up yet, the first request connects instead.
+    try:
+        VectorDatabase()
+    except Exception as e:
+        logging.warning(f"Could not connect to Weaviate on startup: {e}")
+    yield
+    shutdown_pipeline_executor()
+    stop_pipeline_loop()
+    VectorDatabase.close()
+
+
+app = FastAPI(default_response_class=ORJSONResponse, lifespan=lifespan)
 
 
 @app.exception_handler(RequestValidationError)
@@ -26,7 +47,7 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     exc_str = f"{exc}".replace("\n", " ").replace("   ", " ")
     logging.error(f"{request}: {exc_str}")
     content = {"status_code": 10422, "message": exc_str, "data": None}
-    return JSONResponse(
+    return ORJSONResponse(
         content=content, status_code=status.HTTP_422_UNPROCESSABLE_ENTITY
     )
 
@@ -1,5 +1,4 @@
 import logging
-import os
 from typing import Dict, Optional, List
 
 from langchain_core.output_parsers import StrOutputParser
@@ -17,6 +16,7 @@ from ...llm import CompletionArguments
 from app.common.PipelineEnum import PipelineEnum
 from ...llm.langchain import IrisLangchainChatModel
 from ...pipeline import Pipeline
+from ..shared.utils import escape_template_braces, load_prompt
 from ...web.status.status_update import StatusCallback
 
 logger = logging.getLogger(__name__)
@@ -62,11 +62,7 @@ class CodeFeedbackPipeline(Pipeline):
         )
         self.callback = callback
         # Load prompt from file
-        dirname = os.path.dirname(__file__)
-        with open(
-            os.path.join(dirname, "../prompts/code_feedback_prompt.txt"), "r"
-        ) as file:
-            prompt_str = file.read()
+        prompt_str = load_prompt("code_feedback_prompt.txt")
 
         self.output_parser = StrOutputParser()
         # Create the prompt
@@ -147,4 +143,4 @@ class CodeFeedbackPipeline(Pipeline):
         token_usage = self.llm.tokens
         token_usage.pipeline = PipelineEnum.IRIS_CODE_FEEDBACK
         self.tokens = token_usage
-        return response.replace("{", "{{").replace("}", "}}")
+        return escape_template_braces(response)
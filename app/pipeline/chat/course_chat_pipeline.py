@@ -1,27 +1,31 @@
-import json
+import asyncio
 import logging
 import traceback
 import typing
-from datetime import datetime
-from typing import List, Optional, Union
+from datetime import datetime, timezone
+from functools import cache, cached_property, lru_cache
+from typing import List, NamedTuple, Optional, Union
 
-import pytz
+import orjson
 from langchain.agents import create_tool_calling_agent, AgentExecutor
 from langchain_core.messages import SystemMessage
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.prompts import (
     ChatPromptTemplate,
+    MessagesPlaceholder,
 )
 from langchain_core.runnables import Runnable
 from langsmith import traceable
-from weaviate.collections.classes.filters import Filter
 
 from .interaction_suggestion_pipeline import (
     InteractionSuggestionPipeline,
 )
 from .lecture_chat_pipeline import LectureChatPipeline
 from ..shared.citation_pipeline import CitationPipeline
-from ..shared.utils import generate_structured_tools_from_functions
+from ..shared.utils import (
+    generate_structured_tools_from_functions,
+    truncate_lecture_chunks,
+)
 from ...common.message_converters import convert_iris_message_to_langchain_message
 from ...common.pyris_message import PyrisMessage
 from ...domain.data.metrics.competency_jol_dto import CompetencyJolDTO
@@ -43,6 +47,7 @@ from ..prompts.iris_course_chat_prompts_elicit import (
 from ...domain import CourseChatPipelineExecutionDTO
 from app.common.PipelineEnum import PipelineEnum
 from ...retrieval.lecture_retrieval import LectureRetrieval
+from ...retrieval.query_cache import lecture_retrieval_cache, lecture_retrieval_context
 from ...vector_database.database import VectorDatabase
 from ...vector_database.lecture_schema import LectureSchema
 from ...web.status.status_update import (
@@ -56,12 +61,71 @@ from ..pipeline import Pipeline
 logger = logging.getLogger(__name__)
 
 
-def get_mastery(progress, confidence):
+class CourseChatPrompts(NamedTuple):
+    """The prompts of one course chat variant"""
+
+    initial_system_prompt: str
+    begin_agent_prompt: str
+    chat_history_exists_prompt: str
+    no_chat_history_prompt: str
+    begin_agent_jol_prompt: str
+
+
+TELL_PROMPTS = CourseChatPrompts(
+    initial_system_prompt=tell_iris_initial_system_prompt,
+    begin_agent_prompt=tell_begin_agent_prompt,
+    chat_history_exists_prompt=tell_chat_history_exists_prompt,
+    no_chat_history_prompt=tell_no_chat_history_prompt,
+    begin_agent_jol_prompt=tell_begin_agent_jol_prompt,
+)
+ELICIT_PROMPTS = CourseChatPrompts(
+    initial_system_prompt=elicit_iris_initial_system_prompt,
+    begin_agent_prompt=elicit_begin_agent_prompt,
+    chat_history_exists_prompt=elicit_chat_history_exists_prompt,
+    no_chat_history_prompt=elicit_no_chat_history_prompt,
+    begin_agent_jol_prompt=elicit_begin_agent_jol_prompt,
+)
+
+
+# The agent prompt has the same structure for every request, only the messages differ
+AGENT_PROMPT_TEMPLATE = ChatPromptTemplate.from_messages(
+    [
+        MessagesPlaceholder("messages"),
+        ("placeholder", "{agent_scratchpad}"),
+    ]
+)
+
+
+@lru_cache(maxsize=16)
+def split_system_prompt(
+    prompts: CourseChatPrompts, agent_prompt: str, has_chat_history: bool
+) -> tuple[str, ...]:
+    """
+    Joins the static parts of the system prompt and splits it at the current date placeholder.
+    There are only a few combinations, so they are cached.
+    Joining the parts with the current date yields the system prompt.
+    """
+    if has_chat_history:
+        system_prompt = (
+            prompts.initial_system_prompt
+            + "\n"
+            + prompts.chat_history_exists_prompt
+            + "\n"
+            + agent_prompt
+        )
+    else:
+        system_prompt = prompts.initial_system_prompt + "\n" + agent_prompt + "\n"
+    return tuple(system_prompt.split("{current_date}"))
+
+
+def get_mastery(progress: float, confidence: float) -> int:
     """
-    Calculates a user's mastery level for competency given the progress.
+    Calculates a user's mastery level for competency given the progress and confidence.
+    This is a scalar clamp evaluated a few dozen times per request at most.
 
-    :param competency_progress: The user's progress
-    :return: The mastery level
+    :param progress: The user's progress
+    :param confidence: The confidence in the user's progress
+    :return: The mastery level between 0 and 100
     """
 
     return min(100, max(0, round(progress * confidence)))
@@ -74,7 +138,6 @@ class CourseChatPipeline(Pipeline):
     llm_small: IrisLangchainChatModel
     pipeline: Runnable
     lecture_pipeline: LectureChatPipeline
-    suggestion_pipeline: InteractionSuggestionPipeline
     citation_pipeline: CitationPipeline
     callback: CourseChatStatusCallback
     prompt: ChatPromptTemplate
@@ -113,13 +176,17 @@ class CourseChatPipeline(Pipeline):
 
         self.db = VectorDatabase()
         self.retriever = LectureRetrieval(self.db.client)
-        self.suggestion_pipeline = InteractionSuggestionPipeline(variant="course")
         self.citation_pipeline = CitationPipeline()
 
         # Create the pipeline
         self.pipeline = self.llm_big | JsonOutputParser()
         self.tokens = []
 
+    @cached_property
+    def suggestion_pipeline(self) -> InteractionSuggestionPipeline:
+        """The suggestion pipeline is only created once suggestions are actually generated."""
+        return InteractionSuggestionPipeline(variant="course")
+
     def __repr__(self):
         return f"{self.__class__.__name__}(llm_big={self.llm_big}, llm_small={self.llm_small})"
 
@@ -127,13 +194,33 @@ class CourseChatPipeline(Pipeline):
         return f"{self.__class__.__name__}(llm_big={self.llm_big}, llm_small={self.llm_small})"
 
     @traceable(name="Course Chat Pipeline")
-    def __call__(self, dto: CourseChatPipelineExecutionDTO, **kwargs):
+    async def __call__(self, dto: CourseChatPipelineExecutionDTO, **kwargs):
         """
-        Runs the pipeline
+        Runs the pipeline. The agent runs asynchronously, so the LLM calls do not block a thread
+        and the tools the agent requests in one step are executed concurrently.
+        The pipeline loop is shared with other runs, so status updates and database queries are
+        run on threads instead of blocking it.
             :param dto: The pipeline execution data transfer object
             :param kwargs: The keyword arguments
         """
-        logger.debug(dto.model_dump_json(indent=4))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(dto.model_dump_json(indent=4))
+
+        # The request is answered within seconds, so the tools and the prompt share one timestamp
+        current_time = datetime.now(tz=timezone.utc)
+
+        @cache
+        def dump_exercises() -> list[dict]:
+            # The due dates are compared against the request timestamp, so the whole list is fixed per request
+            return [
+                {
+                    **exercise.model_dump(),
+                    "due_date_over": (
+                        exercise.due_date < current_time if exercise.due_date else None
+                    ),
+                }
+                for exercise in dto.course.exercises
+            ]
 
         # Define tools
         def get_exercise_list() -> list[dict]:
@@ -149,15 +236,8 @@ class CourseChatPipeline(Pipeline):
             A 100% score means the student solved the exercise correctly and completed it.
             """
             self.callback.in_progress("Reading exercise list ...")
-            current_time = datetime.now(tz=pytz.UTC)
-            exercises = []
-            for exercise in dto.course.exercises:
-                exercise_dict = exercise.model_dump()
-                exercise_dict["due_date_over"] = (
-                    exercise.due_date < current_time if exercise.due_date else None
-                )
-                exercises.append(exercise_dict)
-            return exercises
+            # The exercises are only serialized once per request, even if the agent asks repeatedly
+            return dump_exercises()
 
         def get_course_details() -> dict:
             """
@@ -211,25 +291,23 @@ class CourseChatPipeline(Pipeline):
             if not dto.metrics or not dto.metrics.exercise_metrics:
                 return "No data available!! Do not requery."
             metrics = dto.metrics.exercise_metrics
-            if metrics.average_score and any(
-                exercise_id in metrics.average_score for exercise_id in exercise_ids
-            ):
-                return {
-                    exercise_id: {
-                        "global_average_score": metrics.average_score[exercise_id],
-                        "score_of_student": metrics.score.get(exercise_id, None),
-                        "global_average_latest_submission": metrics.average_latest_submission.get(
-                            exercise_id, None
-                        ),
-                        "latest_submission_of_student": metrics.latest_submission.get(
-                            exercise_id, None
-                        ),
-                    }
-                    for exercise_id in exercise_ids
-                    if exercise_id in metrics.average_score
+            average_score = metrics.average_score
+            score = metrics.score
+            average_latest_submission = metrics.average_latest_submission
+            latest_submission = metrics.latest_submission
+            exercise_metrics = {
+                exercise_id: {
+                    "global_average_score": average_score[exercise_id],
+                    "score_of_student": score.get(exercise_id),
+                    "global_average_latest_submission": average_latest_submission.get(
+                        exercise_id
+                    ),
+                    "latest_submission_of_student": latest_submission.get(exercise_id),
                 }
-            else:
-                return "No data available! Do not requery."
+                for exercise_id in exercise_ids
+                if exercise_id in average_score
+            }
+            return exercise_metrics or "No data available! Do not requery."
 
         def get_competency_list() -> list:
             """
@@ -251,24 +329,26 @@ class CourseChatPipeline(Pipeline):
             if not dto.metrics or not dto.metrics.competency_metrics:
                 return dto.course.competencies
             competency_metrics = dto.metrics.competency_metrics
-            return [
-                {
-                    "info": competency_metrics.competency_information.get(comp, None),
-                    "exercise_ids": competency_metrics.exercises.get(comp, []),
-                    "progress": competency_metrics.progress.get(comp, 0),
-                    "mastery": get_mastery(
-                        competency_metrics.progress.get(comp, 0),
-                        competency_metrics.confidence.get(comp, 0),
-                    ),
-                    "judgment_of_learning": (
-                        competency_metrics.jol_values.get[comp].json()
-                        if competency_metrics.jol_values
-                        and comp in competency_metrics.jol_values
-                        else None
-                    ),
-                }
-                for comp in competency_metrics.competency_information
-            ]
+            exercises = competency_metrics.exercises
+            progress = competency_metrics.progress
+            confidence = competency_metrics.confidence
+            jol_values = competency_metrics.jol_values or {}
+            competencies = []
+            for comp, info in competency_metrics.competency_information.items():
+                comp_progress = progress.get(comp, 0)
+                jol = jol_values.get(comp)
+                competencies.append(
+                    {
+                        "info": info,
+                        "exercise_ids": exercises.get(comp, []),
+                        "progress": comp_progress,
+                        "mastery": get_mastery(comp_progress, confidence.get(comp, 0)),
+                        "judgment_of_learning": (
+                            jol.model_dump_json() if jol is not None else None
+                        ),
+                    }
+                )
+            return competencies
 
         def lecture_content_retrieval() -> str:
             """
@@ -280,51 +360,40 @@ class CourseChatPipeline(Pipeline):
             Only use this once.
             """
             self.callback.in_progress("Retrieving lecture content ...")
-            self.retrieved_paragraphs = self.retriever(
-                chat_history=history,
-                student_query=query.contents[0].text_content,
-                result_limit=5,
-                course_name=dto.course.name,
-                course_id=dto.course.id,
-                base_url=dto.settings.artemis_base_url,
+            student_query = query.contents[0].text_content
+            # The retriever rewrites the query using the three messages before it
+            retrieved_paragraphs = lecture_retrieval_cache.get_or_compute(
+                context=lecture_retrieval_context(
+                    dto.settings.artemis_base_url, dto.course.id, 5, history[-4:-1]
+                ),
+                query=student_query,
+                embed=self.retriever.embed_query,
+                compute=lambda: self.retriever(
+                    chat_history=history,
+                    student_query=student_query,
+                    result_limit=5,
+                    course_name=dto.course.name,
+                    course_id=dto.course.id,
+                    base_url=dto.settings.artemis_base_url,
+                ),
             )
 
-            result = ""
-            for paragraph in self.retrieved_paragraphs:
-                lct = "Lecture: {}, Unit: {}, Page: {}\nContent:\n---{}---\n\n".format(
-                    paragraph.get(LectureSchema.LECTURE_NAME.value),
-                    paragraph.get(LectureSchema.LECTURE_UNIT_NAME.value),
-                    paragraph.get(LectureSchema.PAGE_NUMBER.value),
-                    paragraph.get(LectureSchema.PAGE_TEXT_CONTENT.value),
-                )
-                result += lct
-            return result
-
-        if dto.user.id % 3 < 2:
-            iris_initial_system_prompt = tell_iris_initial_system_prompt
-            begin_agent_prompt = tell_begin_agent_prompt
-            chat_history_exists_prompt = tell_chat_history_exists_prompt
-            no_chat_history_prompt = tell_no_chat_history_prompt
-            begin_agent_jol_prompt = tell_begin_agent_jol_prompt
-        else:
-            iris_initial_system_prompt = elicit_iris_initial_system_prompt
-            begin_agent_prompt = elicit_begin_agent_prompt
-            chat_history_exists_prompt = elicit_chat_history_exists_prompt
-            no_chat_history_prompt = elicit_no_chat_history_prompt
-            begin_agent_jol_prompt = elicit_begin_agent_jol_prompt
+            # The citations may only refer to the paragraphs and text the agent actually gets to see
+            self.retrieved_paragraphs = truncate_lecture_chunks(retrieved_paragraphs)
+            return "".join(
+                f"Lecture: {paragraph.get(LectureSchema.LECTURE_NAME.value)}, "
+                f"Unit: {paragraph.get(LectureSchema.LECTURE_UNIT_NAME.value)}, "
+                f"Page: {paragraph.get(LectureSchema.PAGE_NUMBER.value)}\n"
+                f"Content:\n---{paragraph.get(LectureSchema.PAGE_TEXT_CONTENT.value)}---\n\n"
+                for paragraph in self.retrieved_paragraphs
+            )
+
+        prompts = TELL_PROMPTS if dto.user.id % 3 < 2 else ELICIT_PROMPTS
 
         try:
             logger.info("Running course chat pipeline...")
-            history: List[PyrisMessage] = dto.chat_history[-5:] or []
-            query: Optional[PyrisMessage] = (
-                dto.chat_history[-1] if dto.chat_history else None
-            )
-
-            # Set up the initial prompt
-            initial_prompt_with_date = iris_initial_system_prompt.replace(
-                "{current_date}",
-                datetime.now(tz=pytz.UTC).strftime("%Y-%m-%d %H:%M:%S"),
-            )
+            history: List[PyrisMessage] = (dto.chat_history or [])[-5:]
+            query: Optional[PyrisMessage] = history[-1] if history else None
 
             if self.event == "jol":
                 event_payload = CompetencyJolDTO.model_validate(dto.event_payload.event)
@@ -337,9 +406,9 @@ class CourseChatPipeline(Pipeline):
                     ),
                     None,
                 )
-                agent_prompt = begin_agent_jol_prompt
+                agent_prompt = prompts.begin_agent_jol_prompt
                 params = {
-                    "jol": json.dumps(
+                    "jol": orjson.dumps(
                         {
                             "value": event_payload.jol_value,
                             "competency_mastery": get_mastery(
@@ -347,12 +416,14 @@ class CourseChatPipeline(Pipeline):
                                 event_payload.competency_confidence,
                             ),
                         }
-                    ),
+                    ).decode(),
                     "competency": comp.model_dump_json(),
                 }
             else:
                 agent_prompt = (
-                    begin_agent_prompt if query is not None else no_chat_history_prompt
+                    prompts.begin_agent_prompt
+                    if query is not None
+                    else prompts.no_chat_history_prompt
                 )
                 params = {
                     "course_name": (
@@ -360,34 +431,19 @@ class CourseChatPipeline(Pipeline):
                     ),
                 }
 
-            if query is not None:
-                # Add the conversation to the prompt
-                chat_history_messages = [
-                    convert_iris_message_to_langchain_message(message)
-                    for message in history
-                ]
-                self.prompt = ChatPromptTemplate.from_messages(
-                    [
-                        SystemMessage(
-                            initial_prompt_with_date
-                            + "\n"
-                            + chat_history_exists_prompt
-                            + "\n"
-                            + agent_prompt
-                        ),
-                        *chat_history_messages,
-                        ("placeholder", "{agent_scratchpad}"),
-                    ]
-                )
-            else:
-                self.prompt = ChatPromptTemplate.from_messages(
-                    [
-                        SystemMessage(
-                            initial_prompt_with_date + "\n" + agent_prompt + "\n"
-                        ),
-                        ("placeholder", "{agent_scratchpad}"),
-                    ]
-                )
+            # Set up the system prompt
+            system_prompt = current_time.strftime("%Y-%m-%d %H:%M:%S").join(
+                split_system_prompt(prompts, agent_prompt, query is not None)
+            )
+
+            # Add the conversation to the prompt
+            chat_history_messages = [
+                convert_iris_message_to_langchain_message(message)
+                for message in history
+            ]
+            self.prompt = AGENT_PROMPT_TEMPLATE.partial(
+                messages=[SystemMessage(system_prompt), *chat_history_messages]
+            )
 
             tool_list = [
                 get_course_details,
@@ -395,7 +451,11 @@ class CourseChatPipeline(Pipeline):
                 get_student_exercise_metrics,
                 get_competency_list,
             ]
-            if self.should_allow_lecture_tool(dto.course.id):
+            if await asyncio.to_thread(
+                self.should_allow_lecture_tool,
+                dto.course.id,
+                dto.settings.artemis_base_url,
+            ):
                 tool_list.append(lecture_content_retrieval)
 
             tools = generate_structured_tools_from_functions(tool_list)
@@ -404,12 +464,17 @@ class CourseChatPipeline(Pipeline):
             agent = create_tool_calling_agent(
                 llm=self.llm_big, tools=tools, prompt=self.prompt
             )
-            agent_executor = AgentExecutor(agent=agent, tools=tools, verbose=False)
+            agent_executor = AgentExecutor(
+                agent=agent,
+                tools=tools,
+                verbose=logger.isEnabledFor(logging.DEBUG),
+                return_intermediate_steps=False,
+            )
 
             out = None
-            self.callback.in_progress()
-            for step in agent_executor.iter(params):
-                print("STEP:", step)
+            await asyncio.to_thread(self.callback.in_progress)
+            async for step in agent_executor.iter(params):
+                logger.debug("Agent step: %s", step)
                 self._append_tokens(
                     self.llm_big.tokens, PipelineEnum.IRIS_CHAT_COURSE_MESSAGE
                 )
@@ -417,11 +482,21 @@ class CourseChatPipeline(Pipeline):
                     out = step["output"]
 
             if self.retrieved_paragraphs:
-                self.callback.in_progress("Augmenting response ...")
-                out = self.citation_pipeline(self.retrieved_paragraphs, out)
+                # Post the status update while the citation request is already running
+                out, _ = await asyncio.gather(
+                    self.citation_pipeline.acall(self.retrieved_paragraphs, out),
+                    asyncio.to_thread(
+                        self.callback.in_progress, "Augmenting response ..."
+                    ),
+                )
             self.tokens.extend(self.citation_pipeline.tokens)
 
-            self.callback.done("Response created", final_result=out, tokens=self.tokens)
+            await asyncio.to_thread(
+                self.callback.done,
+                "Response created",
+                final_result=out,
+                tokens=self.tokens,
+            )
 
             # try:
             #     self.callback.skip("Skipping suggestion generation.")
@@ -448,28 +523,22 @@ class CourseChatPipeline(Pipeline):
                 "An error occurred while running the course chat pipeline", exc_info=e
             )
             traceback.print_exc()
-            self.callback.error(
+            await asyncio.to_thread(
+                self.callback.error,
                 "An error occurred while running the course chat pipeline.",
                 tokens=self.tokens,
             )
 
-    def should_allow_lecture_tool(self, course_id: int) -> bool:
+    def should_allow_lecture_tool(self, course_id: int, base_url: str = None) -> bool:
         """
         Checks if there are indexed lectures for the given course
 
         :param course_id: The course ID
+        :param base_url: The base URL of the Artemis instance of the course
         :return: True if there are indexed lectures for the course, False otherwise
         """
         if course_id:
-            # Fetch the first object that matches the course ID with the language property
-            result = self.db.lectures.query.fetch_objects(
-                filters=Filter.by_property(LectureSchema.COURSE_ID.value).equal(
-                    course_id
-                ),
-                limit=1,
-                return_properties=[LectureSchema.COURSE_NAME.value],
-            )
-            return len(result.objects) > 0
+            return self.db.has_lectures(course_id, base_url)
         return False
 
 
@@ -26,9 +26,11 @@ from ..prompts.iris_exercise_chat_agent_prompts import (
     tell_progress_stalled_system_prompt,
 )
 
-from ..shared.citation_pipeline import CitationPipeline
-from ..shared.reranker_pipeline import RerankerPipeline
-from ..shared.utils import generate_structured_tools_from_functions
+from ..shared.utils import (
+    escape_template_braces,
+    generate_structured_tools_from_functions,
+    truncate_lecture_contents,
+)
 from ...common.PipelineEnum import PipelineEnum
 from ...common.message_converters import convert_iris_message_to_langchain_human_message
 from ...common.pyris_message import PyrisMessage, IrisMessageRole
@@ -40,9 +42,9 @@ from ...llm import CapabilityRequestHandler, RequirementList
 from ...llm import CompletionArguments
 from ...llm.langchain import IrisLangchainChatModel
 from ...retrieval.lecture_retrieval import LectureRetrieval
+from ...retrieval.query_cache import lecture_retrieval_cache, lecture_retrieval_context
 from ...vector_database.database import VectorDatabase
 from ...vector_database.lecture_schema import LectureSchema
-from weaviate.collections.classes.filters import Filter
 from ...web.status.status_update import ExerciseChatStatusCallback
 
 logger = logging.getLogger()
@@ -59,8 +61,8 @@ def add_exercise_context_to_prompt(
     """
     return f"""
     ## Exercise Context
-    - **Exercise Title:** {exercise_title.replace("{", "{{").replace("}", "}}")}
-    - **Problem Statement:** {problem_statement.replace("{", "{{").replace("}", "}}")}
+    - **Exercise Title:** {escape_template_braces(exercise_title)}
+    - **Problem Statement:** {escape_template_braces(problem_statement)}
     - **Programming Language:** {programming_language}
     """
 
@@ -137,10 +139,8 @@ class ExerciseChatAgentPipeline(Pipeline):
         self.db = VectorDatabase()
         self.suggestion_pipeline = InteractionSuggestionPipeline(variant="exercise")
         self.retriever = LectureRetrieval(self.db.client)
-        self.reranker_pipeline = RerankerPipeline()
         self.code_feedback_pipeline = CodeFeedbackPipeline()
         self.pipeline = self.llm_big | JsonOutputParser()
-        self.citation_pipeline = CitationPipeline()
         self.tokens = []
 
     def __repr__(self):
@@ -373,22 +373,37 @@ class ExerciseChatAgentPipeline(Pipeline):
             Only use this once.
             """
             self.callback.in_progress("Retrieving lecture content ...")
-            self.retrieved_paragraphs = self.retriever(
-                chat_history=chat_history,
-                student_query=query.contents[0].text_content,
-                result_limit=5,
-                course_name=dto.course.name,
-                course_id=dto.course.id,
-                base_url=dto.settings.artemis_base_url,
+            student_query = query.contents[0].text_content
+            # The retriever rewrites the query using the last four messages before it
+            self.retrieved_paragraphs = lecture_retrieval_cache.get_or_compute(
+                context=lecture_retrieval_context(
+                    dto.settings.artemis_base_url, dto.course.id, 5, chat_history[-4:]
+                ),
+                query=student_query,
+                embed=self.retriever.embed_query,
+                compute=lambda: self.retriever(
+                    chat_history=chat_history,
+                    student_query=student_query,
+                    result_limit=5,
+                    course_name=dto.course.name,
+                    course_id=dto.course.id,
+                    base_url=dto.settings.artemis_base_url,
+                ),
             )
 
+            contents = truncate_lecture_contents(
+                [
+                    paragraph.get(LectureSchema.PAGE_TEXT_CONTENT.value)
+                    for paragraph in self.retrieved_paragraphs
+                ]
+            )
             result = ""
-            for paragraph in self.retrieved_paragraphs:
+            for paragraph, content in zip(self.retrieved_paragraphs, contents):
                 lct = "Lecture: {}, Unit: {}, Page: {}\nContent:\n---{}---\n\n".format(
                     paragraph.get(LectureSchema.LECTURE_NAME.value),
                     paragraph.get(LectureSchema.LECTURE_UNIT_NAME.value),
                     paragraph.get(LectureSchema.PAGE_NUMBER.value),
-                    paragraph.get(LectureSchema.PAGE_TEXT_CONTENT.value),
+                    content,
                 )
                 result += lct
             return result
@@ -509,7 +524,9 @@ class ExerciseChatAgentPipeline(Pipeline):
                 repository_files,
                 file_lookup,
             ]
-            if self.should_allow_lecture_tool(dto.course.id):
+            if self.should_allow_lecture_tool(
+                dto.course.id, dto.settings.artemis_base_url
+            ):
                 tool_list.append(lecture_content_retrieval)
             tools = generate_structured_tools_from_functions(tool_list)
             agent = create_tool_calling_agent(
@@ -591,21 +608,14 @@ class ExerciseChatAgentPipeline(Pipeline):
                 "An error occurred while running the course chat pipeline."
             )
 
-    def should_allow_lecture_tool(self, course_id: int) -> bool:
+    def should_allow_lecture_tool(self, course_id: int, base_url: str = None) -> bool:
         """
         Checks if there are indexed lectures for the given course
 
         :param course_id: The course ID
+        :param base_url: The base URL of the Artemis instance of the course
         :return: True if there are indexed lectures for the course, False otherwise
         """
         if course_id:
-            # Fetch the first object that matches the course ID with the language property
-            result = self.db.lectures.query.fetch_objects(
-                filters=Filter.by_property(LectureSchema.COURSE_ID.value).equal(
-                    course_id
-                ),
-                limit=1,
-                return_properties=[LectureSchema.COURSE_NAME.value],
-            )
-            return len(result.objects) > 0
+            return self.db.has_lectures(course_id, base_url)
         return False
@@ -1,4 +1,5 @@
 import logging
+import os
 import traceback
 from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict
@@ -10,7 +11,6 @@ from langchain_core.prompts import (
 )
 from langchain_core.runnables import Runnable
 from langsmith import traceable, get_current_run_tree
-from weaviate.collections.classes.filters import Filter
 
 from .code_feedback_pipeline import CodeFeedbackPipeline
 from .interaction_suggestion_pipeline import InteractionSuggestionPipeline
@@ -20,12 +20,12 @@ from ..prompts.iris_exercise_chat_prompts import (
     chat_history_system_prompt,
     final_system_prompt,
     guide_system_prompt,
+    guide_rules_system_prompt,
     no_chat_history_system_prompt,
     progress_stalled_system_prompt,
     build_failed_system_prompt,
 )
-from ..shared.citation_pipeline import CitationPipeline
-from ..shared.reranker_pipeline import RerankerPipeline
+from ..shared.utils import escape_template_braces, truncate_lecture_contents
 from ...common import convert_iris_message_to_langchain_message
 from ...common.pyris_message import PyrisMessage
 from ...domain import ExerciseChatPipelineExecutionDTO
@@ -40,6 +40,7 @@ from ...llm import CompletionArguments
 from app.common.PipelineEnum import PipelineEnum
 from ...llm.langchain import IrisLangchainChatModel
 from ...retrieval.lecture_retrieval import LectureRetrieval
+from ...retrieval.query_cache import lecture_retrieval_cache, lecture_retrieval_context
 from ...vector_database.database import VectorDatabase
 from ...vector_database.lecture_schema import LectureSchema
 from ...web.status.status_update import ExerciseChatStatusCallback
@@ -48,6 +49,52 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+def guide_rewrite_enabled() -> bool:
+    """
+    By default the guide rules are part of the prompt of the only LLM call. ENABLE_GUIDE_REWRITE brings
+    back the previous flow, in which a second call reviews and possibly rewrites the response draft.
+    """
+    return os.environ.get("ENABLE_GUIDE_REWRITE", "False").lower() in ("true", "1")
+
+
+# The static parts of the prompt are parsed once instead of on every request
+INITIAL_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", iris_initial_system_prompt),
+    ]
+)
+CHAT_HISTORY_PROMPT = SystemMessagePromptTemplate.from_template(
+    chat_history_system_prompt
+)
+NO_CHAT_HISTORY_PROMPT = SystemMessagePromptTemplate.from_template(
+    no_chat_history_system_prompt
+)
+LATEST_INPUT_PROMPT = SystemMessagePromptTemplate.from_template(
+    "Consider the student's newest and latest input:"
+)
+EXERCISE_CONTEXT_PROMPT = SystemMessagePromptTemplate.from_template(
+    "Consider the following exercise context:\n"
+    "- Title: {exercise_title}\n"
+    "- Problem Statement: {problem_statement}\n"
+    "- Exercise programming language: {programming_language}"
+)
+PROGRESS_STALLED_PROMPT = SystemMessagePromptTemplate.from_template(
+    progress_stalled_system_prompt
+)
+BUILD_FAILED_PROMPT = SystemMessagePromptTemplate.from_template(
+    build_failed_system_prompt
+)
+FINAL_PROMPT = SystemMessagePromptTemplate.from_template(final_system_prompt)
+GUIDE_RULES_PROMPT = SystemMessagePromptTemplate.from_template(
+    guide_rules_system_prompt
+)
+GUIDE_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        SystemMessagePromptTemplate.from_template(guide_system_prompt),
+    ]
+)
+
+
 class ExerciseChatPipeline(Pipeline):
     """Exercise chat pipeline that answers exercises related questions from students."""
 
@@ -56,7 +103,6 @@ class ExerciseChatPipeline(Pipeline):
     callback: ExerciseChatStatusCallback
     suggestion_pipeline: InteractionSuggestionPipeline
     code_feedback_pipeline: CodeFeedbackPipeline
-    prompt: ChatPromptTemplate
     variant: str
     event: str | None
 
@@ -86,10 +132,8 @@ class ExerciseChatPipeline(Pipeline):
         self.db = VectorDatabase()
         self.suggestion_pipeline = InteractionSuggestionPipeline(variant="exercise")
         self.retriever = LectureRetrieval(self.db.client)
-        self.reranker_pipeline = RerankerPipeline()
         self.code_feedback_pipeline = CodeFeedbackPipeline()
         self.pipeline = self.llm | StrOutputParser()
-        self.citation_pipeline = CitationPipeline()
         self.tokens = []
 
     def __repr__(self):
@@ -107,12 +151,17 @@ class ExerciseChatPipeline(Pipeline):
         """
         try:
             should_execute_lecture_pipeline = self.should_execute_lecture_pipeline(
-                dto.course.id
+                dto.course.id, dto.settings.artemis_base_url
             )
-            self._run_exercise_chat_pipeline(dto, should_execute_lecture_pipeline),
+            exercise_chat_response = self._run_exercise_chat_pipeline(
+                dto, should_execute_lecture_pipeline
+            )
+            if exercise_chat_response is None:
+                # The error has already been reported to the callback
+                return
             self.callback.done(
                 "Generated response",
-                final_result=self.exercise_chat_response,
+                final_result=exercise_chat_response,
                 tokens=self.tokens,
             )
 
@@ -121,10 +170,10 @@ class ExerciseChatPipeline(Pipeline):
                     self.callback.skip(
                         "Skipping suggestion generation as the course is not supported."
                     )
-                elif self.exercise_chat_response:
+                elif exercise_chat_response:
                     suggestion_dto = InteractionSuggestionPipelineExecutionDTO()
                     suggestion_dto.chat_history = dto.chat_history
-                    suggestion_dto.last_message = self.exercise_chat_response
+                    suggestion_dto.last_message = exercise_chat_response
                     suggestion_dto.problem_statement = dto.exercise.problem_statement
                     suggestions = self.suggestion_pipeline(suggestion_dto)
                     if self.suggestion_pipeline.tokens is not None:
@@ -162,17 +211,14 @@ class ExerciseChatPipeline(Pipeline):
         self,
         dto: ExerciseChatPipelineExecutionDTO,
         should_execute_lecture_pipeline: bool = False,
-    ):
+    ) -> str | None:
         """
-        Runs the pipeline
+        Runs the pipeline. The code feedback and the lecture retrieval run concurrently.
         :param dto:  execution data transfer object
-        :param kwargs: The keyword arguments
+        :param should_execute_lecture_pipeline: Whether to retrieve lecture content
+        :return: The response, or None if an error was reported to the callback
         """
-        self.prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", iris_initial_system_prompt),
-            ]
-        )
+        prompt = INITIAL_PROMPT
         logger.info("Running exercise chat pipeline...")
         history: List[PyrisMessage] = dto.chat_history[:-1]
         query: PyrisMessage | None = None
@@ -215,15 +261,28 @@ class ExerciseChatPipeline(Pipeline):
                 )
 
             if should_execute_lecture_pipeline:
+                student_query = query.contents[0].text_content
+                # The assessment and the rewrite only look at the last four messages before the query
                 future_lecture = executor.submit(
-                    self.retriever.basic_lecture_retrieval,
-                    chat_history=history,
-                    student_query=query.contents[0].text_content,
-                    result_limit=3,
-                    course_name=dto.course.name,
-                    course_id=dto.course.id,
-                    base_url=dto.settings.artemis_base_url,
-                    langsmith_extra={"parent": rt},
+                    lecture_retrieval_cache.get_or_compute,
+                    context=lecture_retrieval_context(
+                        dto.settings.artemis_base_url,
+                        dto.course.id,
+                        3,
+                        history[-4:],
+                        basic=True,
+                    ),
+                    query=student_query,
+                    embed=self.retriever.embed_query,
+                    compute=lambda: self.retriever.basic_lecture_retrieval(
+                        chat_history=history,
+                        student_query=student_query,
+                        result_limit=3,
+                        course_name=dto.course.name,
+                        course_id=dto.course.id,
+                        base_url=dto.settings.artemis_base_url,
+                        langsmith_extra={"parent": rt},
+                    ),
                 )
 
             if submission:
@@ -231,7 +290,7 @@ class ExerciseChatPipeline(Pipeline):
                     feedback = future_feedback.result()
                     if self.code_feedback_pipeline.tokens is not None:
                         self.tokens.append(self.code_feedback_pipeline.tokens)
-                    self.prompt += SystemMessagePromptTemplate.from_template(
+                    prompt += SystemMessagePromptTemplate.from_template(
                         "Another AI has checked the code of the student and has found the following issues. "
                         "Use this information to help the student. "
                         "Do not leak that it is coming from a different AI "
@@ -247,20 +306,20 @@ class ExerciseChatPipeline(Pipeline):
                         exception=e,
                         tokens=self.tokens,
                     )
-                    return
+                    return None
 
             # Add the feedbacks to the prompt
             if should_execute_lecture_pipeline:
                 try:
-                    self.retrieved_lecture_chunks = future_lecture.result()
+                    retrieved_lecture_chunks = future_lecture.result()
                     if (
                         self.retriever.tokens is not None
                         and len(self.retriever.tokens) > 0
                     ):
                         self.tokens.extend(self.retriever.tokens)
-                    if len(self.retrieved_lecture_chunks) > 0:
-                        self._add_relevant_chunks_to_prompt(
-                            self.retrieved_lecture_chunks
+                    if len(retrieved_lecture_chunks) > 0:
+                        prompt = self._add_relevant_chunks_to_prompt(
+                            prompt, retrieved_lecture_chunks
                         )
                 except Exception as e:
                     self.callback.error(
@@ -268,83 +327,76 @@ class ExerciseChatPipeline(Pipeline):
                         exception=e,
                         tokens=self.tokens,
                     )
-                    return
+                    return None
 
         self.callback.done()
 
-        self._add_exercise_context_to_prompt(
+        prompt = self._add_exercise_context_to_prompt(
+            prompt,
             submission,
         )
         # Add the chat history and user question to the prompt
-        self._add_conversation_to_prompt(history, query)
+        prompt = self._add_conversation_to_prompt(prompt, history, query)
 
         # Add the final message to the prompt and run the pipeline
         if self.event == "progress_stalled":
-            self.prompt += SystemMessagePromptTemplate.from_template(
-                progress_stalled_system_prompt
-            )
+            prompt += PROGRESS_STALLED_PROMPT
         elif self.event == "build_failed":
-            self.prompt += SystemMessagePromptTemplate.from_template(
-                build_failed_system_prompt
-            )
+            prompt += BUILD_FAILED_PROMPT
         else:
-            self.prompt += SystemMessagePromptTemplate.from_template(
-                final_system_prompt
-            )
-        prompt_val = self.prompt.format_messages(
+            prompt += FINAL_PROMPT
+        guide_rewrite = guide_rewrite_enabled()
+        if not guide_rewrite:
+            prompt += GUIDE_RULES_PROMPT
+        # The formatted messages are passed to the model directly. Turning them back into a
+        # template would parse them again for nothing.
+        messages = prompt.format_messages(
             exercise_title=exercise_title,
             problem_statement=problem_statement,
             programming_language=programming_language,
         )
-        self.prompt = ChatPromptTemplate.from_messages(prompt_val)
         try:
-            response_draft = (
-                (self.prompt | self.pipeline)
-                .with_config({"run_name": "Response Drafting"})
-                .invoke({})
-            )
+            response_draft = self.pipeline.with_config(
+                {"run_name": "Response Drafting"}
+            ).invoke(messages)
             self._append_tokens(
                 self.llm.tokens, PipelineEnum.IRIS_CHAT_EXERCISE_MESSAGE
             )
-            self.callback.done()
-            self.prompt = ChatPromptTemplate.from_messages(
-                [
-                    SystemMessagePromptTemplate.from_template(guide_system_prompt),
-                ]
-            )
-            prompt_val = self.prompt.format_messages(response=response_draft)
-            self.prompt = ChatPromptTemplate.from_messages(prompt_val)
+            if not guide_rewrite:
+                return response_draft
 
-            guide_response = (
-                (self.prompt | self.pipeline)
-                .with_config({"run_name": "Response Refining"})
-                .invoke({})
-            )
+            self.callback.done()
+            messages = GUIDE_PROMPT.format_messages(response=response_draft)
+            guide_response = self.pipeline.with_config(
+                {"run_name": "Response Refining"}
+            ).invoke(messages)
             self._append_tokens(
                 self.llm.tokens, PipelineEnum.IRIS_CHAT_EXERCISE_MESSAGE
             )
 
             if "!ok!" in guide_response:
                 print("Response is ok and not rewritten!!!")
-                self.exercise_chat_response = response_draft
+                return response_draft
             else:
                 print("Response is rewritten.")
-                self.exercise_chat_response = guide_response
+                return guide_response
         except Exception as e:
             self.callback.error(
                 f"Failed to create response: {e}", exception=e, tokens=self.tokens
             )
             # print stack trace
             traceback.print_exc()
-            return "Failed to generate response"
+            return None
 
     def _add_conversation_to_prompt(
         self,
+        prompt: ChatPromptTemplate,
         chat_history: List[PyrisMessage],
         user_question: PyrisMessage,
-    ):
+    ) -> ChatPromptTemplate:
         """
         Adds the chat history and user question to the prompt
+            :param prompt: The prompt to extend
             :param chat_history: The chat history
             :param user_question: The user question
             :return: The prompt with the chat history
@@ -354,80 +406,78 @@ class ExerciseChatPipeline(Pipeline):
                 convert_iris_message_to_langchain_message(message)
                 for message in chat_history[-4:]
             ]
-            self.prompt += SystemMessagePromptTemplate.from_template(
-                chat_history_system_prompt
-            )
-            self.prompt += chat_history_messages
+            prompt += CHAT_HISTORY_PROMPT
+            prompt += chat_history_messages
         else:
-            self.prompt += SystemMessagePromptTemplate.from_template(
-                no_chat_history_system_prompt
-            )
+            prompt += NO_CHAT_HISTORY_PROMPT
         if user_question:
-            self.prompt += SystemMessagePromptTemplate.from_template(
-                "Consider the student's newest and latest input:"
-            )
-            self.prompt += convert_iris_message_to_langchain_message(user_question)
+            prompt += LATEST_INPUT_PROMPT
+            prompt += convert_iris_message_to_langchain_message(user_question)
+        return prompt
 
     def _add_exercise_context_to_prompt(
         self,
+        prompt: ChatPromptTemplate,
         submission: ProgrammingSubmissionDTO,
-    ):
+    ) -> ChatPromptTemplate:
         """Adds the exercise context to the prompt
+        :param prompt: The prompt to extend
         :param submission: The submission
         :param selected_files: The selected files
         """
-        self.prompt += SystemMessagePromptTemplate.from_template(
-            "Consider the following exercise context:\n"
-            "- Title: {exercise_title}\n"
-            "- Problem Statement: {problem_statement}\n"
-            "- Exercise programming language: {programming_language}"
-        )
+        prompt += EXERCISE_CONTEXT_PROMPT
+        return prompt
 
-    def _add_feedbacks_to_prompt(self, feedbacks: List[FeedbackDTO]):
+    def _add_feedbacks_to_prompt(
+        self, prompt: ChatPromptTemplate, feedbacks: List[FeedbackDTO]
+    ) -> ChatPromptTemplate:
         """Adds the feedbacks to the prompt
+        :param prompt: The prompt to extend
         :param feedbacks: The feedbacks
         """
         if feedbacks is not None and len(feedbacks) > 0:
-            prompt = (
+            feedback_prompt = (
                 "These are the feedbacks for the student's repository:\n%s"
             ) % "\n---------\n".join(str(log) for log in feedbacks)
-            self.prompt += SystemMessagePromptTemplate.from_template(prompt)
+            prompt += SystemMessagePromptTemplate.from_template(feedback_prompt)
+        return prompt
 
-    def _add_relevant_chunks_to_prompt(self, retrieved_lecture_chunks: List[dict]):
+    def _add_relevant_chunks_to_prompt(
+        self, prompt: ChatPromptTemplate, retrieved_lecture_chunks: List[dict]
+    ) -> ChatPromptTemplate:
         """
         Adds the relevant chunks of the lecture to the prompt
+        :param prompt: The prompt to extend
         :param retrieved_lecture_chunks: The retrieved lecture chunks
         """
         txt = "Next you will find the potentially relevant lecture content to answer the student message."
         "Use this context to enrich your response.\n"
 
-        for chunk in retrieved_lecture_chunks:
-            props = chunk.get("properties", {})
+        properties = [chunk.get("properties", {}) for chunk in retrieved_lecture_chunks]
+        contents = truncate_lecture_contents(
+            [props.get(LectureSchema.PAGE_TEXT_CONTENT.value) for props in properties]
+        )
+        for props, content in zip(properties, contents):
             lct = "Lecture: {}, Page: {}\nContent:\n---{}---\n\n".format(
                 props.get(LectureSchema.LECTURE_NAME.value),
                 props.get(LectureSchema.PAGE_NUMBER.value),
-                props.get(LectureSchema.PAGE_TEXT_CONTENT.value),
+                content,
             )
             txt += lct
 
-        self.prompt += SystemMessagePromptTemplate.from_template(
-            txt.replace("{", "{{").replace("}", "}}")
+        return prompt + SystemMessagePromptTemplate.from_template(
+            escape_template_braces(txt)
         )
 
-    def should_execute_lecture_pipeline(self, course_id: int) -> bool:
+    def should_execute_lecture_pipeline(
+        self, course_id: int, base_url: str = None
+    ) -> bool:
         """
         Checks if the lecture pipeline should be executed
         :param course_id: The course ID
+        :param base_url: The base URL of the Artemis instance of the course
         :return: True if the lecture pipeline should be executed
         """
         if course_id:
-            # Fetch the first object that matches the course ID with the language property
-            result = self.db.lectures.query.fetch_objects(
-                filters=Filter.by_property(LectureSchema.COURSE_ID.value).equal(
-                    course_id
-                ),
-                limit=1,
-                return_properties=[LectureSchema.COURSE_NAME.value],
-            )
-            return len(result.objects) > 0
+            return self.db.has_lectures(course_id, base_url)
         return False
@@ -36,6 +36,7 @@ from app.common.PipelineEnum import PipelineEnum
 from ...llm.langchain import IrisLangchainChatModel
 
 from ..pipeline import Pipeline
+from ..shared.utils import escape_template_braces
 
 logger = logging.getLogger(__name__)
 
@@ -122,7 +123,7 @@ class InteractionSuggestionPipeline(Pipeline):
             ]
             if dto.last_message:
                 last_message = AIMessage(
-                    content=dto.last_message.replace("{", "{{").replace("}", "}}"),
+                    content=escape_template_braces(dto.last_message),
                 )
                 chat_history_messages.append(last_message)
                 self.prompt = ChatPromptTemplate.from_messages(
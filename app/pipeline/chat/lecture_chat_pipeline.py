@@ -10,6 +10,7 @@ from langchain_core.runnables import Runnable
 from langsmith import traceable
 
 from ..shared.citation_pipeline import CitationPipeline
+from ..shared.utils import escape_template_braces, truncate_lecture_chunks
 from ...common.message_converters import convert_iris_message_to_langchain_message
 from ...common.pyris_message import PyrisMessage
 from ...domain.chat.lecture_chat.lecture_chat_pipeline_execution_dto import (
@@ -18,6 +19,7 @@ from ...domain.chat.lecture_chat.lecture_chat_pipeline_execution_dto import (
 from ...llm import CapabilityRequestHandler, RequirementList
 from app.common.PipelineEnum import PipelineEnum
 from ...retrieval.lecture_retrieval import LectureRetrieval
+from ...retrieval.query_cache import lecture_retrieval_cache, lecture_retrieval_context
 from ...vector_database.database import VectorDatabase
 from ...vector_database.lecture_schema import LectureSchema
 
@@ -115,14 +117,25 @@ class LectureChatPipeline(Pipeline):
 
         self._add_conversation_to_prompt(history, query)
 
-        retrieved_lecture_chunks = self.retriever(
-            chat_history=history,
-            student_query=query.contents[0].text_content,
-            result_limit=5,
-            course_name=dto.course.name,
-            course_id=dto.course.id,
-            base_url=dto.settings.artemis_base_url,
+        student_query = query.contents[0].text_content
+        # The retriever rewrites the query using the last four messages before it
+        retrieved_lecture_chunks = lecture_retrieval_cache.get_or_compute(
+            context=lecture_retrieval_context(
+                dto.settings.artemis_base_url, dto.course.id, 5, history[-4:]
+            ),
+            query=student_query,
+            embed=self.retriever.embed_query,
+            compute=lambda: self.retriever(
+                chat_history=history,
+                student_query=student_query,
+                result_limit=5,
+                course_name=dto.course.name,
+                course_id=dto.course.id,
+                base_url=dto.settings.artemis_base_url,
+            ),
         )
+        # The citations may only refer to the chunks and text the model actually gets to see
+        retrieved_lecture_chunks = truncate_lecture_chunks(retrieved_lecture_chunks)
 
         self._add_relevant_chunks_to_prompt(retrieved_lecture_chunks)
         prompt_val = self.prompt.format_messages()
@@ -173,16 +186,15 @@ class LectureChatPipeline(Pipeline):
     def _add_relevant_chunks_to_prompt(self, retrieved_lecture_chunks: List[dict]):
         """
         Adds the relevant chunks of the lecture to the prompt
-        :param retrieved_lecture_chunks: The retrieved lecture chunks
+        :param retrieved_lecture_chunks: The retrieved lecture chunks, already truncated to fit into the prompt
         """
         self.prompt += SystemMessagePromptTemplate.from_template(
             "Next you will find the relevant lecture content:\n"
         )
-        for i, chunk in enumerate(retrieved_lecture_chunks):
-            text_content_msg = (
-                f" \n {chunk.get(LectureSchema.PAGE_TEXT_CONTENT.value)} \n"
-            )
-            text_content_msg = text_content_msg.replace("{", "{{").replace("}", "}}")
+        for chunk in retrieved_lecture_chunks:
+            content = chunk.get(LectureSchema.PAGE_TEXT_CONTENT.value)
+            text_content_msg = f" \n {content} \n"
+            text_content_msg = escape_template_braces(text_content_msg)
             self.prompt += SystemMessagePromptTemplate.from_template(text_content_msg)
         self.prompt += SystemMessagePromptTemplate.from_template(
             "USE ONLY THE CONTENT YOU NEED TO ANSWER THE QUESTION:\n"
@@ -24,6 +24,8 @@ from app.common.PipelineEnum import PipelineEnum
 from ..llm.langchain import IrisLangchainChatModel
 from ..vector_database.lecture_schema import init_lecture_schema, LectureSchema
 from ..ingestion.abstract_ingestion import AbstractIngestion
+from ..retrieval.query_cache import invalidate_lecture_retrieval_cache
+from .shared.utils import load_prompt
 from ..llm import (
     BasicRequestHandler,
     CompletionArguments,
@@ -36,6 +38,9 @@ from ..web.status import ingestion_status_callback
 
 batch_update_lock = threading.Lock()
 
+# Number of chunks embedded per request. 256 chunks of at most 512 characters stay well below the token limit.
+EMBEDDING_BATCH_SIZE = 256
+
 
 def cleanup_temporary_file(file_path):
     """
@@ -143,6 +148,9 @@ class LectureIngestionPipeline(AbstractIngestion, Pipeline):
             self.callback.done("Lecture Chunking and interpretation Finished")
             self.callback.in_progress("Ingesting lecture chunks into database...")
             self.batch_update(chunks)
+            invalidate_lecture_retrieval_cache(
+                self.dto.settings.artemis_base_url, self.dto.lecture_unit.course_id
+            )
             self.callback.done("Lecture Ingestion Finished", tokens=self.tokens)
             logger.info(
                 f"Lecture ingestion pipeline finished Successfully for course "
@@ -168,11 +176,17 @@ class LectureIngestionPipeline(AbstractIngestion, Pipeline):
         with batch_update_lock:
             with self.collection.batch.rate_limit(requests_per_minute=600) as batch:
                 try:
-                    for index, chunk in enumerate(chunks):
-                        embed_chunk = self.llm_embedding.embed(
-                            chunk[LectureSchema.PAGE_TEXT_CONTENT.value]
+                    for start in range(0, len(chunks), EMBEDDING_BATCH_SIZE):
+                        end = start + EMBEDDING_BATCH_SIZE
+                        chunk_batch = chunks[start:end]
+                        embeddings = self.llm_embedding.embed_batch(
+                            [
+                                chunk[LectureSchema.PAGE_TEXT_CONTENT.value]
+                                for chunk in chunk_batch
+                            ]
                         )
-                        batch.add_object(properties=chunk, vector=embed_chunk)
+                        for chunk, embedding in zip(chunk_batch, embeddings):
+                            batch.add_object(properties=chunk, vector=embedding)
                 except Exception as e:
                     logger.error(f"Error updating lecture unit: {e}")
                     self.callback.error(
@@ -267,13 +281,9 @@ class LectureIngestionPipeline(AbstractIngestion, Pipeline):
         """
         Merge the text and image together
         """
-        dirname = os.path.dirname(__file__)
-        prompt_file_path = os.path.join(
-            dirname, ".", "prompts", "content_image_interpretation_merge_prompt.txt"
+        lecture_ingestion_prompt = load_prompt(
+            "content_image_interpretation_merge_prompt.txt"
         )
-        with open(prompt_file_path, "r") as file:
-            logger.info("Loading ingestion prompt...")
-            lecture_ingestion_prompt = file.read()
         prompt = ChatPromptTemplate.from_messages(
             [
                 ("system", lecture_ingestion_prompt),
@@ -344,6 +354,7 @@ class LectureIngestionPipeline(AbstractIngestion, Pipeline):
                     lecture_unit_id
                 )
             )
+            invalidate_lecture_retrieval_cache(base_url, course_id)
             return True
         except Exception as e:
             logger.error(f"Error deleting lecture unit: {e}", exc_info=True)
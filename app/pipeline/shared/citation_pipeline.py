@@ -1,4 +1,3 @@
-import os
 from asyncio.log import logger
 from typing import List, Union
 
@@ -10,6 +9,7 @@ from app.llm import CapabilityRequestHandler, RequirementList, CompletionArgumen
 from app.common.PipelineEnum import PipelineEnum
 from app.llm.langchain import IrisLangchainChatModel
 from app.pipeline import Pipeline
+from app.pipeline.shared.utils import escape_template_braces, load_prompt
 
 from app.vector_database.lecture_schema import LectureSchema
 
@@ -34,10 +34,7 @@ class CitationPipeline(Pipeline):
             request_handler=request_handler,
             completion_args=CompletionArguments(temperature=0, max_tokens=4000),
         )
-        dirname = os.path.dirname(__file__)
-        prompt_file_path = os.path.join(dirname, "..", "prompts", "citation_prompt.txt")
-        with open(prompt_file_path, "r") as file:
-            self.prompt_str = file.read()
+        self.prompt_str = load_prompt("citation_prompt.txt")
         self.pipeline = self.llm | StrOutputParser()
         self.tokens = []
 
@@ -62,7 +59,26 @@ class CitationPipeline(Pipeline):
             )
             formatted_string += lct
 
-        return formatted_string.replace("{", "{{").replace("}", "}}")
+        return escape_template_braces(formatted_string)
+
+    def _create_chain(self, paragraphs: Union[List[dict], List[str]], answer: str):
+        """Create the chain and its input for the given paragraphs and answer."""
+        self.default_prompt = PromptTemplate(
+            template=self.prompt_str,
+            input_variables=["Answer", "Paragraphs"],
+        )
+        chain_input = {
+            "Answer": answer,
+            "Paragraphs": self.create_formatted_string(paragraphs),
+        }
+        return self.default_prompt | self.pipeline, chain_input
+
+    def _handle_response(self, response: str, answer: str) -> str:
+        self._append_tokens(self.llm.tokens, PipelineEnum.IRIS_CITATION_PIPELINE)
+        if response == "!NONE!":
+            return answer
+        print(response)
+        return response
 
     def __call__(
         self,
@@ -76,21 +92,28 @@ class CitationPipeline(Pipeline):
             :param query: The query
             :return: Selected file content
         """
-        paras = self.create_formatted_string(paragraphs)
+        try:
+            chain, chain_input = self._create_chain(paragraphs, answer)
+            return self._handle_response(chain.invoke(chain_input), answer)
+        except Exception as e:
+            logger.error("citation pipeline failed", e)
+            raise e
 
+    async def acall(
+        self,
+        paragraphs: Union[List[dict], List[str]],
+        answer: str,
+        **kwargs,
+    ) -> str:
+        """
+        Runs the pipeline without blocking the event loop
+            :param paragraphs: List of paragraphs which can be list of dicts or list of strings
+            :param answer: The answer to add the citations to
+            :return: The answer with citations
+        """
         try:
-            self.default_prompt = PromptTemplate(
-                template=self.prompt_str,
-                input_variables=["Answer", "Paragraphs"],
-            )
-            response = (self.default_prompt | self.pipeline).invoke(
-                {"Answer": answer, "Paragraphs": paras}
-            )
-            self._append_tokens(self.llm.tokens, PipelineEnum.IRIS_CITATION_PIPELINE)
-            if response == "!NONE!":
-                return answer
-            print(response)
-            return response
+            chain, chain_input = self._create_chain(paragraphs, answer)
+            return self._handle_response(await chain.ainvoke(chain_input), answer)
         except Exception as e:
             logger.error("citation pipeline failed", e)
             raise e
@@ -1,5 +1,3 @@
-import os
-from asyncio.log import logger
 from typing import Optional, List, Union
 
 from langchain_core.output_parsers import PydanticOutputParser
@@ -12,11 +10,30 @@ from app.llm import CapabilityRequestHandler, RequirementList, CompletionArgumen
 from app.common.PipelineEnum import PipelineEnum
 from app.llm.langchain import IrisLangchainChatModel
 from app.pipeline import Pipeline
+from app.pipeline.shared.utils import (
+    MAX_LECTURE_CHUNK_CHARS,
+    load_prompt,
+    truncate_lecture_contents,
+)
 from app.pipeline.chat.output_models.output_models.selected_paragraphs import (
     SelectedParagraphs,
 )
 from app.vector_database.lecture_schema import LectureSchema
 
+# The schema of the selected paragraphs never changes, so its format instructions and
+# the default prompt are built once instead of for every pipeline
+OUTPUT_PARSER = PydanticOutputParser(pydantic_object=SelectedParagraphs)
+FORMAT_INSTRUCTIONS = OUTPUT_PARSER.get_format_instructions()
+DEFAULT_PROMPT = PromptTemplate(
+    template=load_prompt("reranker_prompt.txt"),
+    input_variables=[
+        "question",
+        "paragraphs",
+        "chat_history",
+    ],
+    partial_variables={"format_instructions": FORMAT_INSTRUCTIONS},
+)
+
 
 class RerankerPipeline(Pipeline):
     """A generic reranker pipeline that can be used to rerank a list of documents based on a question"""
@@ -38,24 +55,8 @@ class RerankerPipeline(Pipeline):
             request_handler=request_handler,
             completion_args=CompletionArguments(temperature=0, max_tokens=4000),
         )
-        dirname = os.path.dirname(__file__)
-        prompt_file_path = os.path.join(dirname, "..", "prompts", "reranker_prompt.txt")
-        with open(prompt_file_path, "r") as file:
-            logger.info("Loading reranker prompt...")
-            prompt_str = file.read()
-
-        self.output_parser = PydanticOutputParser(pydantic_object=SelectedParagraphs)
-        self.default_prompt = PromptTemplate(
-            template=prompt_str,
-            input_variables=[
-                "question",
-                "paragraphs" "chat_history",
-            ],
-            partial_variables={
-                "format_instructions": self.output_parser.get_format_instructions()
-            },
-        )
-        logger.debug(self.output_parser.get_format_instructions())
+        self.output_parser = OUTPUT_PARSER
+        self.default_prompt = DEFAULT_PROMPT
         self.pipeline = self.llm | self.output_parser
         self.tokens = []
 
@@ -83,10 +84,17 @@ class RerankerPipeline(Pipeline):
         # Determine if paragraphs are a list of dicts or strings and prepare data accordingly
         paras = ""
         if paragraphs and isinstance(paragraphs[0], dict):
-            for i, paragraph in enumerate(paragraphs):
-                paras += "Paragraph {}:\n{}\n".format(
-                    str(i), paragraph.get(LectureSchema.PAGE_TEXT_CONTENT.value, "")
-                )
+            # The beginning of a page is enough to judge its relevance, so long pages are cut
+            # to keep the prompt short. Every paragraph is kept so the indices stay valid.
+            contents = truncate_lecture_contents(
+                [
+                    paragraph.get(LectureSchema.PAGE_TEXT_CONTENT.value, "")
+                    for paragraph in paragraphs
+                ],
+                max_total_chars=MAX_LECTURE_CHUNK_CHARS * len(paragraphs),
+            )
+            for i, content in enumerate(contents):
+                paras += "Paragraph {}:\n{}\n".format(str(i), content)
         elif paragraphs and isinstance(paragraphs[0], str):
             for i, paragraph in enumerate(paragraphs):
                 paras += "Paragraph {}:\n{}\n".format(str(i), paragraph)
@@ -95,12 +103,10 @@ class RerankerPipeline(Pipeline):
                 "Invalid input type for paragraphs. Must be a list of dictionaries or a list of strings."
             )
 
+        # The last four messages in chronological order
         text_chat_history = [
-            chat_history[-i - 1].contents[0].text_content
-            for i in range(min(4, len(chat_history)))  # Ensure no out-of-bounds error
-        ][
-            ::-1
-        ]  # Reverse to get the messages in chronological order of their appearance  data["question"] = query
+            message.contents[0].text_content for message in chat_history[-4:]
+        ]
         data = {
             "chat_history": text_chat_history,
             "question": query,
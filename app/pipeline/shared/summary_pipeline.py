@@ -1,5 +1,4 @@
 import logging
-import os
 
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate
@@ -8,6 +7,7 @@ from langchain_core.runnables import Runnable
 from ...llm import CapabilityRequestHandler, RequirementList
 from ...llm.langchain import IrisLangchainCompletionModel
 from ...pipeline import Pipeline
+from .utils import load_prompt
 
 logger = logging.getLogger(__name__)
 
@@ -33,10 +33,7 @@ class SummaryPipeline(Pipeline):
             request_handler=request_handler, max_tokens=1000
         )
         # Load the prompt from a file
-        dirname = os.path.dirname(__file__)
-        with open(os.path.join(dirname, "../prompts/summary_prompt.txt"), "r") as file:
-            logger.info("Loading summary prompt...")
-            self.prompt_str = file.read()
+        self.prompt_str = load_prompt("summary_prompt.txt")
         # Create the prompt
         self.prompt = ChatPromptTemplate.from_messages(
             [
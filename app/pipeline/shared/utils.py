@@ -1,7 +1,18 @@
-from typing import Callable, List
+import os
+from functools import lru_cache
+from typing import Callable, List, Optional
 
 from langchain_core.tools import StructuredTool
 
+from ...vector_database.lecture_schema import LectureSchema
+
+_BRACE_TABLE = str.maketrans({"{": "{{", "}": "}}"})
+_PROMPTS_DIR = os.path.join(os.path.dirname(__file__), "..", "prompts")
+
+# Limits for the lecture content added to a prompt, a slide rarely has more text than a chunk may take
+MAX_LECTURE_CHUNK_CHARS = 1500
+MAX_LECTURE_CONTENT_CHARS = 6000
+
 
 def generate_structured_tool_from_function(tool_function: Callable) -> StructuredTool:
     """
@@ -21,3 +32,64 @@ def generate_structured_tools_from_functions(
     :return: The list of structured tools
     """
     return [generate_structured_tool_from_function(_tool) for _tool in tools]
+
+
+def escape_template_braces(text: str) -> str:
+    """
+    Escapes the curly braces in a text so it can be used literally in a prompt template
+    :param text: The text to escape
+    :return: The escaped text
+    """
+    return text.translate(_BRACE_TABLE)
+
+
+@lru_cache(maxsize=None)
+def load_prompt(file_name: str) -> str:
+    """
+    Loads a prompt from the prompts directory. The files do not change at runtime, so each is only read once
+    :param file_name: The name of the prompt file
+    :return: The prompt
+    """
+    with open(os.path.join(_PROMPTS_DIR, file_name), "r") as file:
+        return file.read()
+
+
+def truncate_lecture_contents(
+    contents: List[Optional[str]],
+    max_chars_per_chunk: int = MAX_LECTURE_CHUNK_CHARS,
+    max_total_chars: int = MAX_LECTURE_CONTENT_CHARS,
+) -> List[str]:
+    """
+    Truncates the text contents of retrieved lecture chunks so they fit into a prompt.
+    The contents are expected in rank order, so the best chunks come first. Once the total budget is used up,
+    the remaining chunks are dropped, so the result may be shorter than the input.
+    :param contents: The text contents of the chunks in rank order
+    :param max_chars_per_chunk: The maximum number of characters of one chunk
+    :param max_total_chars: The maximum number of characters of all chunks together
+    :return: The truncated contents
+    """
+    truncated = []
+    budget = max_total_chars
+    for content in contents:
+        if budget <= 0:
+            break
+        content = (content or "")[: min(max_chars_per_chunk, budget)]
+        budget -= len(content)
+        truncated.append(content)
+    return truncated
+
+
+def truncate_lecture_chunks(chunks: List[dict]) -> List[dict]:
+    """
+    Truncates the text contents of retrieved lecture chunks like truncate_lecture_contents, keeping their other
+    properties. Dropped chunks are left out, so the result is exactly the content the prompt shows and may cite.
+    :param chunks: The retrieved lecture chunks in rank order
+    :return: Copies of the chunks that fit into the prompt, with their truncated contents
+    """
+    contents = truncate_lecture_contents(
+        [chunk.get(LectureSchema.PAGE_TEXT_CONTENT.value) for chunk in chunks]
+    )
+    return [
+        {**chunk, LectureSchema.PAGE_TEXT_CONTENT.value: content}
+        for chunk, content in zip(chunks, contents)
+    ]
@@ -1,4 +1,5 @@
 from asyncio.log import logger
+from itertools import chain
 from typing import List
 
 from langsmith import traceable
@@ -11,6 +12,7 @@ from ..common.message_converters import convert_iris_message_to_langchain_messag
 from ..common.pyris_message import PyrisMessage
 from ..llm.langchain import IrisLangchainChatModel
 from ..pipeline import Pipeline
+from .query_cache import course_language_cache, query_embedding_cache
 
 from app.llm import (
     BasicRequestHandler,
@@ -20,6 +22,7 @@ from app.llm import (
 )
 from app.pipeline.shared.reranker_pipeline import RerankerPipeline
 from app.vector_database.lecture_schema import init_lecture_schema, LectureSchema
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import (
     ChatPromptTemplate,
@@ -38,6 +41,57 @@ from ..pipeline.prompts.lecture_retrieval_prompts import (
 )
 import concurrent.futures
 
+# The assessment prompts have no variables and are used as messages directly
+ASSESSMENT_PROMPT = SystemMessage(assessment_prompt)
+ASSESSMENT_FINAL_PROMPT = SystemMessage(assessment_prompt_final)
+
+# The static parts of the rewrite prompts are parsed once instead of on every call
+REWRITE_STUDENT_QUERY_INITIAL_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", lecture_retriever_initial_prompt),
+    ]
+)
+REWRITE_STUDENT_QUERY_PROMPT = SystemMessagePromptTemplate.from_template(
+    rewrite_student_query_prompt
+)
+REWRITE_STUDENT_QUERY_WITH_EXERCISE_CONTEXT_INITIAL_PROMPT = (
+    ChatPromptTemplate.from_messages(
+        [
+            ("system", lecture_retrieval_initial_prompt_with_exercise_context),
+        ]
+    )
+)
+REWRITE_STUDENT_QUERY_WITH_EXERCISE_CONTEXT_PROMPT = (
+    SystemMessagePromptTemplate.from_template(
+        rewrite_student_query_prompt_with_exercise_context
+    )
+)
+HYPOTHETICAL_ANSWER_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", write_hypothetical_answer_prompt),
+    ]
+)
+HYPOTHETICAL_ANSWER_WITH_EXERCISE_CONTEXT_PROMPT = ChatPromptTemplate.from_messages(
+    [
+        ("system", write_hypothetical_answer_with_exercise_context_prompt),
+    ]
+)
+
+# The properties the chats and the citation pipeline read from a retrieved chunk
+CITATION_PROPERTIES = [
+    LectureSchema.LECTURE_NAME.value,
+    LectureSchema.LECTURE_UNIT_NAME.value,
+    LectureSchema.LECTURE_UNIT_LINK.value,
+    LectureSchema.PAGE_NUMBER.value,
+    LectureSchema.PAGE_TEXT_CONTENT.value,
+]
+# The basic retrieval is only used to add lecture content to a prompt, not for citations
+BASIC_PROPERTIES = [
+    LectureSchema.LECTURE_NAME.value,
+    LectureSchema.PAGE_NUMBER.value,
+    LectureSchema.PAGE_TEXT_CONTENT.value,
+]
+
 
 def merge_retrieved_chunks(
     basic_retrieved_lecture_chunks, hyde_retrieved_lecture_chunks
@@ -47,14 +101,13 @@ def merge_retrieved_chunks(
     duplicate IDs, the properties from hyde_retrieved_lecture_chunks will overwrite those from
     basic_retrieved_lecture_chunks.
     """
-    merged_chunks = {}
-    for chunk in basic_retrieved_lecture_chunks:
-        merged_chunks[chunk["id"]] = chunk["properties"]
-
-    for chunk in hyde_retrieved_lecture_chunks:
-        merged_chunks[chunk["id"]] = chunk["properties"]
-
-    return [properties for uuid, properties in merged_chunks.items()]
+    merged_chunks = {
+        chunk["id"]: chunk["properties"]
+        for chunk in chain(
+            basic_retrieved_lecture_chunks, hyde_retrieved_lecture_chunks
+        )
+    }
+    return list(merged_chunks.values())
 
 
 def _add_last_four_messages_to_prompt(
@@ -119,7 +172,7 @@ class LectureRetrieval(Pipeline):
         """
         Retrieve lecture data from the database.
         """
-        course_language = self.fetch_course_language(course_id)
+        course_language = self.fetch_course_language(course_id, base_url)
 
         response, response_hyde = self.run_parallel_rewrite_tasks(
             chat_history=chat_history,
@@ -141,9 +194,15 @@ class LectureRetrieval(Pipeline):
             {"id": obj.uuid.int, "properties": obj.properties}
             for obj in response_hyde.objects
         ]
-        merged_chunks = merge_retrieved_chunks(
-            basic_retrieved_lecture_chunks, hyde_retrieved_lecture_chunks
-        )
+        # Pages without text, e.g. slides with only images, cannot be relevant to the query.
+        # Dropping them keeps them out of the reranker prompt and skips its call if none are left.
+        merged_chunks = [
+            chunk
+            for chunk in merge_retrieved_chunks(
+                basic_retrieved_lecture_chunks, hyde_retrieved_lecture_chunks
+            )
+            if (chunk.get(LectureSchema.PAGE_TEXT_CONTENT.value) or "").strip()
+        ]
         if len(merged_chunks) != 0:
             selected_chunks_index = self.reranker_pipeline(
                 paragraphs=merged_chunks, query=student_query, chat_history=chat_history
@@ -177,6 +236,7 @@ class LectureRetrieval(Pipeline):
             result_limit=result_limit,
             course_id=course_id,
             base_url=base_url,
+            return_properties=BASIC_PROPERTIES,
         )
 
         basic_retrieved_lecture_chunks: list[dict[str, dict]] = [
@@ -189,25 +249,18 @@ class LectureRetrieval(Pipeline):
     def assess_question(
         self, chat_history: list[PyrisMessage], student_query: str
     ) -> bool:
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", assessment_prompt),
-            ]
-        )
-        prompt = _add_last_four_messages_to_prompt(prompt, chat_history)
-        prompt += ChatPromptTemplate.from_messages(
-            [
-                ("user", student_query),
-            ]
-        )
-        prompt += ChatPromptTemplate.from_messages(
-            [
-                ("system", assessment_prompt_final),
-            ]
-        )
+        messages = [
+            ASSESSMENT_PROMPT,
+            *(
+                convert_iris_message_to_langchain_message(message)
+                for message in (chat_history or [])[-4:]
+            ),
+            HumanMessage(student_query),
+            ASSESSMENT_FINAL_PROMPT,
+        ]
 
         try:
-            response = (prompt | self.pipeline).invoke({})
+            response = self.pipeline.invoke(messages)
             logger.info(f"Response from assessment pipeline: {response}")
             return response == "YES"
         except Exception as e:
@@ -224,23 +277,17 @@ class LectureRetrieval(Pipeline):
         """
         Rewrite the student query.
         """
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", lecture_retriever_initial_prompt),
-            ]
-        )
-        prompt = _add_last_four_messages_to_prompt(prompt, chat_history)
-        prompt += SystemMessagePromptTemplate.from_template(
-            rewrite_student_query_prompt
+        prompt = _add_last_four_messages_to_prompt(
+            REWRITE_STUDENT_QUERY_INITIAL_PROMPT, chat_history
         )
-        prompt_val = prompt.format_messages(
+        prompt += REWRITE_STUDENT_QUERY_PROMPT
+        messages = prompt.format_messages(
             course_language=course_language,
             course_name=course_name,
             student_query=student_query,
         )
-        prompt = ChatPromptTemplate.from_messages(prompt_val)
         try:
-            response = (prompt | self.pipeline).invoke({})
+            response = self.pipeline.invoke(messages)
             token_usage = self.llm.tokens
             token_usage.pipeline = PipelineEnum.IRIS_LECTURE_RETRIEVAL_PIPELINE
             self.tokens.append(self.llm.tokens)
@@ -262,25 +309,19 @@ class LectureRetrieval(Pipeline):
         """
         Rewrite the student query to generate fitting lecture content and embed it.
         """
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", lecture_retrieval_initial_prompt_with_exercise_context),
-            ]
-        )
-        prompt = _add_last_four_messages_to_prompt(prompt, chat_history)
-        prompt += SystemMessagePromptTemplate.from_template(
-            rewrite_student_query_prompt_with_exercise_context
+        prompt = _add_last_four_messages_to_prompt(
+            REWRITE_STUDENT_QUERY_WITH_EXERCISE_CONTEXT_INITIAL_PROMPT, chat_history
         )
-        prompt_val = prompt.format_messages(
+        prompt += REWRITE_STUDENT_QUERY_WITH_EXERCISE_CONTEXT_PROMPT
+        messages = prompt.format_messages(
             course_language=course_language,
             course_name=course_name,
             exercise_name=exercise_name,
             problem_statement=problem_statement,
             student_query=student_query,
         )
-        prompt = ChatPromptTemplate.from_messages(prompt_val)
         try:
-            response = (prompt | self.pipeline).invoke({})
+            response = self.pipeline.invoke(messages)
             token_usage = self.llm.tokens
             token_usage.pipeline = PipelineEnum.IRIS_LECTURE_RETRIEVAL_PIPELINE
             self.tokens.append(self.llm.tokens)
@@ -301,24 +342,16 @@ class LectureRetrieval(Pipeline):
         Rewrite the student query to generate fitting lecture content and embed it.
         To extract more relevant content from the vector database.
         """
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", write_hypothetical_answer_prompt),
-            ]
+        prompt = _add_last_four_messages_to_prompt(
+            HYPOTHETICAL_ANSWER_PROMPT, chat_history
         )
-        prompt = _add_last_four_messages_to_prompt(prompt, chat_history)
-        prompt += ChatPromptTemplate.from_messages(
-            [
-                ("user", student_query),
-            ]
-        )
-        prompt_val = prompt.format_messages(
+        # The query is added as a message so that braces in it are not read as template variables
+        messages = prompt.format_messages(
             course_language=course_language,
             course_name=course_name,
-        )
-        prompt = ChatPromptTemplate.from_messages(prompt_val)
+        ) + [HumanMessage(student_query)]
         try:
-            response = (prompt | self.pipeline).invoke({})
+            response = self.pipeline.invoke(messages)
             token_usage = self.llm.tokens
             token_usage.pipeline = PipelineEnum.IRIS_LECTURE_RETRIEVAL_PIPELINE
             self.tokens.append(self.llm.tokens)
@@ -341,26 +374,17 @@ class LectureRetrieval(Pipeline):
         Rewrite the student query to generate fitting lecture content and embed it.
         To extract more relevant content from the vector database.
         """
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", write_hypothetical_answer_with_exercise_context_prompt),
-            ]
+        prompt = _add_last_four_messages_to_prompt(
+            HYPOTHETICAL_ANSWER_WITH_EXERCISE_CONTEXT_PROMPT, chat_history
         )
-        prompt = _add_last_four_messages_to_prompt(prompt, chat_history)
-        prompt_val = prompt.format_messages(
+        messages = prompt.format_messages(
             course_language=course_language,
             course_name=course_name,
             exercise_name=exercise_name,
             problem_statement=problem_statement,
-        )
-        prompt = ChatPromptTemplate.from_messages(prompt_val)
-        prompt += ChatPromptTemplate.from_messages(
-            [
-                ("user", student_query),
-            ]
-        )
+        ) + [HumanMessage(student_query)]
         try:
-            response = (prompt | self.pipeline).invoke({})
+            response = self.pipeline.invoke(messages)
             token_usage = self.llm.tokens
             token_usage.pipeline = PipelineEnum.IRIS_LECTURE_RETRIEVAL_PIPELINE
             self.tokens.append(self.llm.tokens)
@@ -369,6 +393,12 @@ class LectureRetrieval(Pipeline):
         except Exception as e:
             raise e
 
+    def embed_query(self, query: str) -> list[float]:
+        """
+        Embed a search query. Query embeddings are cached across requests.
+        """
+        return query_embedding_cache.embed(self.llm_embedding, query)
+
     @traceable(name="Retrieval: Search in DB")
     def search_in_db(
         self,
@@ -377,9 +407,11 @@ class LectureRetrieval(Pipeline):
         result_limit: int,
         course_id: int = None,
         base_url: str = None,
+        return_properties: List[str] = None,
     ):
         """
         Search the database for the given query.
+        Only the given properties are returned, by default those the chats and the citations use.
         """
         logger.info(f"Searching in the database for query: {query}")
         # Initialize filter to None by default
@@ -398,18 +430,11 @@ class LectureRetrieval(Pipeline):
                     LectureSchema.BASE_URL.value
                 ).equal(base_url)
 
-        vec = self.llm_embedding.embed(query)
         return_value = self.collection.query.hybrid(
             query=query,
             alpha=hybrid_factor,
-            vector=vec,
-            return_properties=[
-                LectureSchema.COURSE_ID.value,
-                LectureSchema.LECTURE_UNIT_NAME.value,
-                LectureSchema.LECTURE_UNIT_LINK.value,
-                LectureSchema.PAGE_NUMBER.value,
-                LectureSchema.PAGE_TEXT_CONTENT.value,
-            ],
+            vector=self.embed_query(query),
+            return_properties=return_properties or CITATION_PROPERTIES,
             limit=result_limit,
             filters=filter_weaviate,
         )
@@ -429,74 +454,39 @@ class LectureRetrieval(Pipeline):
         exercise_title: str = None,
     ):
         """
-        Run the rewrite tasks in parallel.
+        Run the basic and the HyDE retrieval in parallel. Each rewrites the query and searches the database with it.
         """
         if problem_statement:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                # Schedule the rewrite tasks to run in parallel
-                rewritten_query_future = executor.submit(
-                    self.rewrite_student_query_with_exercise_context,
-                    chat_history,
-                    student_query,
-                    course_language,
-                    course_name,
-                    exercise_title,
-                    problem_statement,
-                )
-                hypothetical_answer_query_future = executor.submit(
-                    self.rewrite_elaborated_query_with_exercise_context,
-                    chat_history,
-                    student_query,
-                    course_language,
-                    course_name,
-                    exercise_title,
-                    problem_statement,
-                )
-
-                # Get the results once both tasks are complete
-                rewritten_query: str = rewritten_query_future.result()
-                hypothetical_answer_query: str = (
-                    hypothetical_answer_query_future.result()
-                )
+            rewrite_tasks = (
+                self.rewrite_student_query_with_exercise_context,
+                self.rewrite_elaborated_query_with_exercise_context,
+            )
+            rewrite_args = (
+                chat_history,
+                student_query,
+                course_language,
+                course_name,
+                exercise_title,
+                problem_statement,
+            )
         else:
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                # Schedule the rewrite tasks to run in parallel
-                rewritten_query_future = executor.submit(
-                    self.rewrite_student_query,
-                    chat_history,
-                    student_query,
-                    course_language,
-                    course_name,
-                )
-                hypothetical_answer_query_future = executor.submit(
-                    self.rewrite_elaborated_query,
-                    chat_history,
-                    student_query,
-                    course_language,
-                    course_name,
-                )
-
-                # Get the results once both tasks are complete
-                rewritten_query = rewritten_query_future.result()
-                hypothetical_answer_query = hypothetical_answer_query_future.result()
+            rewrite_tasks = (self.rewrite_student_query, self.rewrite_elaborated_query)
+            rewrite_args = (chat_history, student_query, course_language, course_name)
 
-            # Execute the database search tasks
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            response_future = executor.submit(
-                self.search_in_db,
-                query=rewritten_query,
+        def rewrite_and_search(rewrite_task):
+            query = rewrite_task(*rewrite_args)
+            return self.search_in_db(
+                query=query,
                 hybrid_factor=0.9,
                 result_limit=result_limit,
                 course_id=course_id,
                 base_url=base_url,
             )
-            response_hyde_future = executor.submit(
-                self.search_in_db,
-                query=hypothetical_answer_query,
-                hybrid_factor=0.9,
-                result_limit=result_limit,
-                course_id=course_id,
-                base_url=base_url,
+
+        # Each search starts as soon as its own rewrite is done instead of waiting for the slower one
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            response_future, response_hyde_future = (
+                executor.submit(rewrite_and_search, task) for task in rewrite_tasks
             )
 
             # Get the results once both tasks are complete
@@ -505,19 +495,27 @@ class LectureRetrieval(Pipeline):
 
         return response, response_hyde
 
-    def fetch_course_language(self, course_id):
+    def fetch_course_language(self, course_id, base_url: str = None):
         """
         Fetch the language of the course based on the course ID.
         If no specific language is set, it defaults to English.
         """
-        course_language = "english"
+        cached = course_language_cache.get(base_url, course_id)
+        if cached is not None:
+            return cached
 
+        course_language = "english"
         if course_id:
-            # Fetch the first object that matches the course ID with the language property
+            filter_weaviate = Filter.by_property(LectureSchema.COURSE_ID.value).equal(
+                course_id
+            )
+            if base_url:
+                filter_weaviate &= Filter.by_property(
+                    LectureSchema.BASE_URL.value
+                ).equal(base_url)
+            # Fetch the first object that matches the course with the language property
             result = self.collection.query.fetch_objects(
-                filters=Filter.by_property(LectureSchema.COURSE_ID.value).equal(
-                    course_id
-                ),
+                filters=filter_weaviate,
                 limit=1,  # We only need one object to check and retrieve the language
                 return_properties=[LectureSchema.COURSE_LANGUAGE.value],
             )
@@ -529,5 +527,6 @@ class LectureRetrieval(Pipeline):
                 )
                 if fetched_language:
                     course_language = fetched_language
+                course_language_cache.put(base_url, course_id, course_language)
 
         return course_language
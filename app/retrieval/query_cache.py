@@ -0,0 +1,268 @@
+import hashlib
+import logging
+import math
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Hashable, List, Optional
+
+from ..common.pyris_message import PyrisMessage
+from ..domain.data.text_message_content_dto import TextMessageContentDTO
+from ..llm.request_handler import RequestHandler
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_query(query: str) -> str:
+    # Umlauts may arrive precomposed or as a base letter with a combining mark depending on the client
+    return " ".join(unicodedata.normalize("NFC", query).lower().split())
+
+
+def _normalize_vector(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    return [value / norm for value in vector] if norm else vector
+
+
+def history_fingerprint(chat_history: List[PyrisMessage]) -> Hashable:
+    """
+    Get a fingerprint of the chat history preceding a query. The retriever rewrites the query
+    based on the history, so results may only be shared between requests with the same history.
+    """
+    return tuple(
+        (
+            message.sender,
+            tuple(
+                content.text_content
+                for content in message.contents
+                if isinstance(content, TextMessageContentDTO)
+            ),
+        )
+        for message in chat_history
+    )
+
+
+class _CacheEntry:
+    __slots__ = ("context", "vector", "value", "expires_at")
+
+    def __init__(self, context, vector, value, expires_at):
+        self.context = context
+        self.vector = vector
+        self.value = value
+        self.expires_at = expires_at
+
+
+class QueryCache:
+    """
+    Thread-safe LRU cache with a TTL for retrieval results.
+    Entries are looked up by their exact normalized query first. On a miss, the entry with the most
+    similar query embedding within the same context is used if the cosine similarity reaches the threshold.
+    The context must contain everything besides the query that the results depend on, e.g. the course.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 256,
+        ttl: float = 300,
+        similarity_threshold: float = 0.95,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self._entries: OrderedDict[Hashable, _CacheEntry] = OrderedDict()
+        self._lock = threading.RLock()
+        self._hits = 0
+        self._misses = 0
+
+    def get_or_compute(
+        self,
+        context: Hashable,
+        query: str,
+        embed: Callable[[str], List[float]],
+        compute: Callable[[], list],
+    ) -> list:
+        """
+        Get the cached results for the query or compute and cache them.
+        embed is only called if there is no exact match for the query.
+        """
+        key = (context, _normalize_query(query))
+        value = self._get_exact(key)
+        if value is not None:
+            return value
+
+        vector = _normalize_vector(embed(key[1]))
+        value = self._get_similar(context, vector)
+        if value is not None:
+            return value
+
+        value = compute()
+        self._put(key, _CacheEntry(context, vector, value, time.monotonic() + self.ttl))
+        return value
+
+    def invalidate(self, predicate: Callable[[Hashable], bool]):
+        """Remove all entries whose context matches the predicate."""
+        with self._lock:
+            for key in [
+                key for key, entry in self._entries.items() if predicate(entry.context)
+            ]:
+                del self._entries[key]
+
+    def _get_exact(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.expires_at < time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            self._record(hit=True)
+            return entry.value
+
+    def _get_similar(self, context: Hashable, vector: List[float]):
+        with self._lock:
+            now = time.monotonic()
+            best_key, best_similarity = None, self.similarity_threshold
+            for key, entry in self._entries.items():
+                if entry.context != context or entry.expires_at < now:
+                    continue
+                similarity = sum(a * b for a, b in zip(vector, entry.vector))
+                if similarity >= best_similarity:
+                    best_key, best_similarity = key, similarity
+            if best_key is None:
+                self._record(hit=False)
+                return None
+            self._entries.move_to_end(best_key)
+            self._record(hit=True)
+            return self._entries[best_key].value
+
+    def _put(self, key: Hashable, entry: _CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            now = time.monotonic()
+            for expired_key in [
+                k for k, e in self._entries.items() if e.expires_at < now
+            ]:
+                del self._entries[expired_key]
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _record(self, hit: bool):
+        if hit:
+            self._hits += 1
+        else:
+            self._misses += 1
+        logger.info(
+            f"Retrieval cache {'hit' if hit else 'miss'}, hit rate: "
+            f"{self._hits / (self._hits + self._misses):.2%} ({self._hits}/{self._hits + self._misses})"
+        )
+
+
+class EmbeddingCache:
+    """
+    Thread-safe LRU cache with a TTL for embeddings of search queries.
+    Entries are keyed on the embedding model and the BLAKE2b hash of the text, so the texts themselves are not kept.
+    """
+
+    def __init__(self, max_size: int = 2000, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[str, str], tuple[List[float], float]] = (
+            OrderedDict()
+        )
+        self._lock = threading.RLock()
+
+    def embed(self, request_handler: RequestHandler, text: str) -> List[float]:
+        """Get the embedding of the text from the cache or the model."""
+        key = (
+            request_handler.model_id,
+            hashlib.blake2b(text.encode(), digest_size=16).hexdigest(),
+        )
+        vector = self._get(key)
+        if vector is None:
+            vector = request_handler.embed(text)
+            self._put(key, vector)
+        return vector
+
+    def _get(self, key: tuple[str, str]):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def _put(self, key: tuple[str, str], vector: List[float]):
+        with self._lock:
+            self._entries[key] = (vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class CourseLanguageCache:
+    """
+    Thread-safe LRU cache with a TTL for the languages of courses with indexed lectures.
+    Entries are keyed on the Artemis base URL and the course ID, like the lecture search filter.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[tuple[str, int], tuple[str, float]] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, base_url: str, course_id: int) -> Optional[str]:
+        """Get the cached language of the course, or None if it is not cached."""
+        with self._lock:
+            entry = self._entries.get((base_url, course_id))
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            self._entries.move_to_end((base_url, course_id))
+            return entry[0]
+
+    def put(self, base_url: str, course_id: int, language: str):
+        """Cache the language of the course."""
+        with self._lock:
+            self._entries[(base_url, course_id)] = (
+                language,
+                time.monotonic() + self.ttl,
+            )
+            self._entries.move_to_end((base_url, course_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, base_url: str, course_id: int):
+        """Remove the cached language of the course."""
+        with self._lock:
+            self._entries.pop((base_url, course_id), None)
+
+
+# Embeddings do not depend on the lectures, so this cache is never invalidated
+query_embedding_cache = EmbeddingCache()
+
+# Shared by all pipelines of the process, invalidated by the ingestion pipeline when lectures change
+lecture_retrieval_cache = QueryCache()
+
+# Courses without lectures are not cached, so their language is found as soon as lectures are ingested
+course_language_cache = CourseLanguageCache()
+
+
+def lecture_retrieval_context(
+    base_url: str,
+    course_id: int,
+    result_limit: int,
+    chat_history: List[PyrisMessage],
+    basic: bool = False,
+) -> Hashable:
+    """
+    Get the cache context of a lecture retrieval. The course always comes first.
+    The basic retrieval returns other results than the full one, so they are cached separately.
+    """
+    return base_url, course_id, result_limit, basic, history_fingerprint(chat_history)
+
+
+def invalidate_lecture_retrieval_cache(base_url: str, course_id: int):
+    """Drop the cached lecture retrievals and the language of a course after its lectures changed."""
+    lecture_retrieval_cache.invalidate(
+        lambda context: context[:2] == (base_url, course_id)
+    )
+    course_language_cache.invalidate(base_url, course_id)
@@ -1,9 +1,13 @@
 import logging
+import time
 import weaviate
-from .lecture_schema import init_lecture_schema
+from weaviate.classes.init import AdditionalConfig, Timeout
+from weaviate.config import ConnectionConfig
+from .lecture_schema import init_lecture_schema, reset_lecture_schema, LectureSchema
 from weaviate.classes.query import Filter
 from app.config import settings
 import threading
+from typing import Optional
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +20,11 @@ class VectorDatabase:
     _lock = threading.Lock()
     _client_instance = None
 
+    # Courses known to have indexed lectures, mapped to when that was last checked.
+    # Only positive results are cached, so newly ingested lectures are found immediately.
+    _courses_with_lectures: dict[tuple[int, Optional[str]], float] = {}
+    _courses_with_lectures_ttl = 300
+
     def __init__(self):
         with VectorDatabase._lock:
             if not VectorDatabase._client_instance:
@@ -23,17 +32,66 @@ class VectorDatabase:
                     host=settings.weaviate.host,
                     port=settings.weaviate.port,
                     grpc_port=settings.weaviate.grpc_port,
+                    # Every request thread shares this client, so keep enough pooled
+                    # connections alive for concurrent pipelines
+                    additional_config=AdditionalConfig(
+                        connection=ConnectionConfig(
+                            session_pool_connections=20,
+                            session_pool_maxsize=100,
+                        ),
+                        timeout=Timeout(init=5, query=30, insert=90),
+                    ),
                 )
                 logger.info("Weaviate client initialized")
         self.client = VectorDatabase._client_instance
         self.lectures = init_lecture_schema(self.client)
 
+    @classmethod
+    def close(cls):
+        """
+        Close the shared Weaviate client
+        """
+        with cls._lock:
+            if cls._client_instance:
+                cls._client_instance.close()
+                cls._client_instance = None
+                logger.info("Weaviate client closed")
+
+    def has_lectures(self, course_id: int, base_url: Optional[str] = None) -> bool:
+        """
+        Check if there are indexed lectures for the given course.
+        Pass the Artemis base URL to match the filter of the lecture search, course IDs are only unique per instance.
+        """
+        key = (course_id, base_url)
+        checked_at = VectorDatabase._courses_with_lectures.get(key)
+        if (
+            checked_at is not None
+            and time.monotonic() - checked_at
+            < VectorDatabase._courses_with_lectures_ttl
+        ):
+            return True
+        filters = Filter.by_property(LectureSchema.COURSE_ID.value).equal(course_id)
+        if base_url:
+            filters &= Filter.by_property(LectureSchema.BASE_URL.value).equal(base_url)
+        # Fetch the id of the first matching object only, no properties need to be loaded
+        result = self.lectures.query.fetch_objects(
+            filters=filters,
+            limit=1,
+            return_properties=[],
+        )
+        if len(result.objects) > 0:
+            VectorDatabase._courses_with_lectures[key] = time.monotonic()
+            return True
+        VectorDatabase._courses_with_lectures.pop(key, None)
+        return False
+
     def delete_collection(self, collection_name):
         """
         Delete a collection from the database
         """
         if self.client.collections.exists(collection_name):
             if self.client.collections.delete(collection_name):
+                reset_lecture_schema(self.client)
                 logger.info(f"Collection {collection_name} deleted")
             else:
                 logger.error(f"Collection {collection_name} failed to delete")
@@ -1,3 +1,5 @@
+import threading
+import weakref
 from enum import Enum
 
 from weaviate.classes.config import Property
@@ -26,9 +28,34 @@ class LectureSchema(Enum):
     BASE_URL = "base_url"
 
 
+# The schema checks take several round trips, so they only run once per client
+_lecture_collections: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+_lecture_collections_lock = threading.Lock()
+
+
 def init_lecture_schema(client: WeaviateClient) -> Collection:
     """
-    Initialize the schema for the lecture slides
+    Initialize the schema for the lecture slides, or return the collection if it was initialized before
+    """
+    with _lecture_collections_lock:
+        collection = _lecture_collections.get(client)
+        if collection is None:
+            collection = _create_or_migrate_lecture_schema(client)
+            _lecture_collections[client] = collection
+        return collection
+
+
+def reset_lecture_schema(client: WeaviateClient):
+    """
+    Forget the initialized lecture collection of the client, e.g. after the collection was deleted
+    """
+    with _lecture_collections_lock:
+        _lecture_collections.pop(client, None)
+
+
+def _create_or_migrate_lecture_schema(client: WeaviateClient) -> Collection:
+    """
+    Create the schema for the lecture slides or add the properties missing in an existing one
     """
     if client.collections.exists(LectureSchema.COLLECTION_NAME.value):
         collection = client.collections.get(LectureSchema.COLLECTION_NAME.value)
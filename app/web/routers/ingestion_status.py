@@ -1,6 +1,6 @@
-import json
 from urllib.parse import unquote
 
+import orjson
 from fastapi import APIRouter, status, Response, Depends
 from fastapi.params import Query
 from weaviate.collections.classes.filters import Filter
@@ -18,6 +18,12 @@ class IngestionState(str, Enum):
     NOT_STARTED = "NOT_STARTED"
 
 
+# There are only two possible responses, so their bodies are encoded once
+_INGESTION_STATE_BODIES = {
+    state: orjson.dumps({"state": state.value}) for state in IngestionState
+}
+
+
 @router.get(
     "/courses/{course_id}/lectures/{lecture_id}/lectureUnits/{lecture_unit_id}/ingestion-state",
     dependencies=[Depends(TokenValidator())],
@@ -48,15 +54,11 @@ def get_lecture_unit_ingestion_state(
         return_properties=[LectureSchema.LECTURE_UNIT_NAME.value],
     )
 
-    if len(result.objects) > 0:
-        return Response(
-            status_code=status.HTTP_200_OK,
-            content=json.dumps({"state": IngestionState.DONE.value}),
-            media_type="application/json",
-        )
-    else:
-        return Response(
-            status_code=status.HTTP_200_OK,
-            content=json.dumps({"state": IngestionState.NOT_STARTED.value}),
-            media_type="application/json",
-        )
+    state = (
+        IngestionState.DONE if len(result.objects) > 0 else IngestionState.NOT_STARTED
+    )
+    return Response(
+        status_code=status.HTTP_200_OK,
+        content=_INGESTION_STATE_BODIES[state],
+        media_type="application/json",
+    )
@@ -1,11 +1,14 @@
+import asyncio
 import logging
+import os
 import traceback
-from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
 
 from sentry_sdk import capture_exception
 
 from fastapi import APIRouter, status, Response, Depends, Body, Query
 
+from app.common.pipeline_loop import run_on_pipeline_loop
 from app.domain import (
     ExerciseChatPipelineExecutionDTO,
     CourseChatPipelineExecutionDTO,
@@ -35,6 +38,19 @@ from app.web.status.status_update import TextExerciseChatCallback
 router = APIRouter(prefix="/api/v1/pipelines", tags=["pipelines"])
 logger = logging.getLogger(__name__)
 
+# Pipeline runs are queued on a bounded pool instead of each getting a new thread,
+# so a burst of requests cannot exhaust the threads of the process. The endpoints are async
+# because they only submit the run, which does not need a thread of FastAPI's own pool.
+pipeline_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("PIPELINE_WORKERS", "16")),
+    thread_name_prefix="pipeline",
+)
+
+
+def shutdown_pipeline_executor():
+    """Cancel the queued pipeline runs. Runs that have already started are completed."""
+    pipeline_executor.shutdown(wait=False, cancel_futures=True)
+
 
 def run_exercise_chat_pipeline_worker(
     dto: ExerciseChatPipelineExecutionDTO, variant: str, event: str | None = None
@@ -67,17 +83,25 @@ def run_exercise_chat_pipeline_worker(
     status_code=status.HTTP_202_ACCEPTED,
     dependencies=[Depends(TokenValidator())],
 )
-def run_exercise_chat_pipeline(
+async def run_exercise_chat_pipeline(
     variant: str,
     event: str | None = Query(None, description="Event query parameter"),
     dto: ExerciseChatPipelineExecutionDTO = Body(
         description="Exercise Chat Pipeline Execution DTO"
     ),
 ):
-    thread = Thread(
-        target=run_exercise_chat_pipeline_worker, args=(dto, variant, event)
-    )
-    thread.start()
+    pipeline_executor.submit(run_exercise_chat_pipeline_worker, dto, variant, event)
+
+
+async def run_course_chat_pipeline_coroutine(
+    pipeline: CourseChatPipeline, callback: CourseChatStatusCallback, dto
+):
+    try:
+        await pipeline(dto=dto)
+    except Exception as e:
+        logger.error(f"Error running exercise chat pipeline: {e}")
+        logger.error(traceback.format_exc())
+        await asyncio.to_thread(callback.error, "Fatal error.", exception=e)
 
 
 def run_course_chat_pipeline_worker(dto, variant, event):
@@ -94,12 +118,9 @@ def run_course_chat_pipeline_worker(dto, variant, event):
         capture_exception(e)
         return
 
-    try:
-        pipeline(dto=dto)
-    except Exception as e:
-        logger.error(f"Error running exercise chat pipeline: {e}")
-        logger.error(traceback.format_exc())
-        callback.error("Fatal error.", exception=e)
+    # Only the synchronous setup runs on this thread. The run itself is interleaved with
+    # the other runs on the pipeline loop, so the thread is free again right away.
+    run_on_pipeline_loop(run_course_chat_pipeline_coroutine(pipeline, callback, dto))
 
 
 @router.post(
@@ -107,15 +128,14 @@ def run_course_chat_pipeline_worker(dto, variant, event):
     status_code=status.HTTP_202_ACCEPTED,
     dependencies=[Depends(TokenValidator())],
 )
-def run_course_chat_pipeline(
+async def run_course_chat_pipeline(
     variant: str,
     event: str | None = Query(None, description="Event query parameter"),
     dto: CourseChatPipelineExecutionDTO = Body(
         description="Course Chat Pipeline Execution DTO"
     ),
 ):
-    thread = Thread(target=run_course_chat_pipeline_worker, args=(dto, variant, event))
-    thread.start()
+    pipeline_executor.submit(run_course_chat_pipeline_worker, dto, variant, event)
 
 
 def run_text_exercise_chat_pipeline_worker(dto, variant):
@@ -177,11 +197,10 @@ def run_lecture_chat_pipeline_worker(dto, variant):
     status_code=status.HTTP_202_ACCEPTED,
     dependencies=[Depends(TokenValidator())],
 )
-def run_text_exercise_chat_pipeline(
+async def run_text_exercise_chat_pipeline(
     variant: str, dto: TextExerciseChatPipelineExecutionDTO
 ):
-    thread = Thread(target=run_text_exercise_chat_pipeline_worker, args=(dto, variant))
-    thread.start()
+    pipeline_executor.submit(run_text_exercise_chat_pipeline_worker, dto, variant)
 
 
 @router.post(
@@ -189,9 +208,8 @@ def run_text_exercise_chat_pipeline(
     status_code=status.HTTP_202_ACCEPTED,
     dependencies=[Depends(TokenValidator())],
 )
-def run_lecture_chat_pipeline(variant: str, dto: LectureChatPipelineExecutionDTO):
-    thread = Thread(target=run_lecture_chat_pipeline_worker, args=(dto, variant))
-    thread.start()
+async def run_lecture_chat_pipeline(variant: str, dto: LectureChatPipelineExecutionDTO):
+    pipeline_executor.submit(run_lecture_chat_pipeline_worker, dto, variant)
 
 
 def run_competency_extraction_pipeline_worker(
@@ -223,13 +241,10 @@ def run_competency_extraction_pipeline_worker(
     status_code=status.HTTP_202_ACCEPTED,
     dependencies=[Depends(TokenValidator())],
 )
-def run_competency_extraction_pipeline(
+async def run_competency_extraction_pipeline(
     variant: str, dto: CompetencyExtractionPipelineExecutionDTO
 ):
-    thread = Thread(
-        target=run_competency_extraction_pipeline_worker, args=(dto, variant)
-    )
-    thread.start()
+    pipeline_executor.submit(run_competency_extraction_pipeline_worker, dto, variant)
 
 
 @router.get("/{feature}/variants")
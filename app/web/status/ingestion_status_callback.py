@@ -40,6 +40,8 @@ class IngestionStatusCallback(StatusCallback):
                 name="Slides ingestion",
             ),
         ]
-        status = IngestionStatusUpdateDTO(stages=stages, id=lecture_unit_id)
+        status = IngestionStatusUpdateDTO.model_construct(
+            stages=stages, id=lecture_unit_id
+        )
         stage = stages[current_stage_index]
         super().__init__(url, run_id, status, stage, current_stage_index)
@@ -26,6 +26,6 @@ class LecturesDeletionStatusCallback(StatusCallback):
                 weight=100, state=StageStateEnum.NOT_STARTED, name="Slides removal"
             ),
         ]
-        status = IngestionStatusUpdateDTO(stages=stages)
+        status = IngestionStatusUpdateDTO.model_construct(stages=stages)
         stage = stages[current_stage_index]
         super().__init__(url, run_id, status, stage, current_stage_index)
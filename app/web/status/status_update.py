@@ -1,3 +1,4 @@
+import threading
 from typing import Optional, List
 
 from sentry_sdk import capture_exception, capture_message
@@ -28,6 +29,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Updates are sent while holding the lock of the run, so a hanging Artemis must not block its tools for long
+STATUS_UPDATE_TIMEOUT = 10
+
 
 class StatusCallback(ABC):
     """
@@ -53,18 +57,27 @@ class StatusCallback(ABC):
         self.status = status
         self.stage = stage
         self.current_stage_index = current_stage_index
+        # Agent tools run concurrently and report their progress from different threads
+        self._lock = threading.RLock()
 
     def on_status_update(self):
         """Send a status update to the Artemis API."""
+        with self._lock:
+            self._send_status_update()
+
+    def _send_status_update(self):
         try:
-            print(self.status.dict(by_alias=True))
+            # Serialize straight to JSON in pydantic-core instead of building a dict for requests to re-encode
+            payload = self.status.model_dump_json(by_alias=True)
+            print(payload)
             requests.post(
                 self.url,
                 headers={
                     "Content-Type": "application/json",
                     "Authorization": f"Bearer {self.run_id}",
                 },
-                json=self.status.model_dump(by_alias=True),
+                data=payload.encode("utf-8"),
+                timeout=STATUS_UPDATE_TIMEOUT,
             ).raise_for_status()
         except requests.exceptions.RequestException as e:
             logger.error(f"Error sending status update: {e}")
@@ -84,18 +97,19 @@ class StatusCallback(ABC):
 
     def in_progress(self, message: Optional[str] = None):
         """Transition the current stage to IN_PROGRESS and update the status."""
-        if self.stage.state == StageStateEnum.NOT_STARTED:
-            self.stage.state = StageStateEnum.IN_PROGRESS
-            self.stage.message = message
-            self.on_status_update()
-        elif self.stage.state == StageStateEnum.IN_PROGRESS:
-            self.stage.message = message
-            self.on_status_update()
-        else:
-            raise ValueError(
-                "Invalid state transition to in_progress. current state is ",
-                self.stage.state,
-            )
+        with self._lock:
+            if self.stage.state == StageStateEnum.NOT_STARTED:
+                self.stage.state = StageStateEnum.IN_PROGRESS
+                self.stage.message = message
+                self.on_status_update()
+            elif self.stage.state == StageStateEnum.IN_PROGRESS:
+                self.stage.message = message
+                self.on_status_update()
+            else:
+                raise ValueError(
+                    "Invalid state transition to in_progress. current state is ",
+                    self.stage.state,
+                )
 
     def done(
         self,
@@ -111,23 +125,24 @@ class StatusCallback(ABC):
         If there is a next stage, set the current
         stage to the next stage.
         """
-        self.stage.state = StageStateEnum.DONE
-        self.stage.message = message
-        self.status.result = final_result
-        self.status.tokens = tokens or self.status.tokens
-        if hasattr(self.status, "suggestions"):
-            self.status.suggestions = suggestions
-        next_stage = self.get_next_stage()
-        if next_stage is not None:
-            self.stage = next_stage
-            if next_stage_message:
-                self.stage.message = next_stage_message
-            if start_next_stage:
-                self.stage.state = StageStateEnum.IN_PROGRESS
-        self.on_status_update()
-        self.status.result = None
-        if hasattr(self.status, "suggestions"):
-            self.status.suggestions = None
+        with self._lock:
+            self.stage.state = StageStateEnum.DONE
+            self.stage.message = message
+            self.status.result = final_result
+            self.status.tokens = tokens or self.status.tokens
+            if hasattr(self.status, "suggestions"):
+                self.status.suggestions = suggestions
+            next_stage = self.get_next_stage()
+            if next_stage is not None:
+                self.stage = next_stage
+                if next_stage_message:
+                    self.stage.message = next_stage_message
+                if start_next_stage:
+                    self.stage.state = StageStateEnum.IN_PROGRESS
+            self.on_status_update()
+            self.status.result = None
+            if hasattr(self.status, "suggestions"):
+                self.status.suggestions = None
 
     def error(
         self, message: str, exception=None, tokens: Optional[List[TokenUsageDTO]] = None
@@ -136,47 +151,49 @@ class StatusCallback(ABC):
         Transition the current stage to ERROR and update the status.
         Set all later stages to SKIPPED if an error occurs.
         """
-        self.stage.state = StageStateEnum.ERROR
-        self.stage.message = message
-        self.status.result = None
-        self.status.suggestions = None
-        self.status.tokens = tokens or self.status.tokens
-        # Set all subsequent stages to SKIPPED if an error occurs
-        rest_of_index = (
-            self.current_stage_index + 1
-        )  # Black and flake8 are conflicting with each other if this expression gets used in list comprehension
-        for stage in self.status.stages[rest_of_index:]:
-            stage.state = StageStateEnum.SKIPPED
-            stage.message = "Skipped due to previous error"
+        with self._lock:
+            self.stage.state = StageStateEnum.ERROR
+            self.stage.message = message
+            self.status.result = None
+            self.status.suggestions = None
+            self.status.tokens = tokens or self.status.tokens
+            # Set all subsequent stages to SKIPPED if an error occurs
+            rest_of_index = (
+                self.current_stage_index + 1
+            )  # Black and flake8 are conflicting with each other if this expression gets used in list comprehension
+            for stage in self.status.stages[rest_of_index:]:
+                stage.state = StageStateEnum.SKIPPED
+                stage.message = "Skipped due to previous error"
 
-        # Update the status after setting the stages to SKIPPED
-        self.stage = self.status.stages[-1]
-        self.on_status_update()
-        logger.error(
-            f"Error occurred in job {self.run_id} in stage {self.stage.name}: {message}"
-        )
-        if exception:
-            capture_exception(exception)
-        else:
-            capture_message(
+            # Update the status after setting the stages to SKIPPED
+            self.stage = self.status.stages[-1]
+            self.on_status_update()
+            logger.error(
                 f"Error occurred in job {self.run_id} in stage {self.stage.name}: {message}"
             )
+            if exception:
+                capture_exception(exception)
+            else:
+                capture_message(
+                    f"Error occurred in job {self.run_id} in stage {self.stage.name}: {message}"
+                )
 
     def skip(self, message: Optional[str] = None, start_next_stage: bool = True):
         """
         Transition the current stage to SKIPPED and update the status.
         If there is a next stage, set the current stage to the next stage.
         """
-        self.stage.state = StageStateEnum.SKIPPED
-        self.stage.message = message
-        self.status.result = None
-        self.status.suggestions = None
-        next_stage = self.get_next_stage()
-        if next_stage is not None:
-            self.stage = next_stage
-            if start_next_stage:
-                self.stage.state = StageStateEnum.IN_PROGRESS
-        self.on_status_update()
+        with self._lock:
+            self.stage.state = StageStateEnum.SKIPPED
+            self.stage.message = message
+            self.status.result = None
+            self.status.suggestions = None
+            next_stage = self.get_next_stage()
+            if next_stage is not None:
+                self.stage = next_stage
+                if start_next_stage:
+                    self.stage.state = StageStateEnum.IN_PROGRESS
+            self.on_status_update()
 
 
 class CourseChatStatusCallback(StatusCallback):
@@ -196,7 +213,7 @@ class CourseChatStatusCallback(StatusCallback):
             #     weight=10, state=StageStateEnum.NOT_STARTED, name="Creating suggestions"
             # ),
         ]
-        status = CourseChatStatusUpdateDTO(stages=stages)
+        status = CourseChatStatusUpdateDTO.model_construct(stages=stages)
         stage = stages[current_stage_index]
         super().__init__(url, run_id, status, stage, current_stage_index)
 
@@ -218,7 +235,7 @@ class ExerciseChatStatusCallback(StatusCallback):
                 weight=10, state=StageStateEnum.NOT_STARTED, name="Creating suggestions"
             ),
         ]
-        status = ExerciseChatStatusUpdateDTO(stages=stages)
+        status = ExerciseChatStatusUpdateDTO.model_construct(stages=stages)
         stage = stages[current_stage_index]
         super().__init__(url, run_id, status, stage, current_stage_index)
 
@@ -248,7 +265,7 @@ class TextExerciseChatCallback(StatusCallback):
         super().__init__(
             url,
             run_id,
-            TextExerciseChatStatusUpdateDTO(stages=stages),
+            TextExerciseChatStatusUpdateDTO.model_construct(stages=stages),
             stages[stage],
             stage,
         )
@@ -270,7 +287,7 @@ class CompetencyExtractionCallback(StatusCallback):
                 name="Generating Competencies",
             )
         )
-        status = CompetencyExtractionStatusUpdateDTO(stages=stages)
+        status = CompetencyExtractionStatusUpdateDTO.model_construct(stages=stages)
         stage = stages[-1]
         super().__init__(url, run_id, status, stage, len(stages) - 1)
 
@@ -295,7 +312,7 @@ class LectureChatCallback(StatusCallback):
         super().__init__(
             url,
             run_id,
-            LectureChatStatusUpdateDTO(stages=stages, result=""),
+            LectureChatStatusUpdateDTO.model_construct(stages=stages, result=""),
             stages[stage],
             stage,
         )